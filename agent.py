@@ -1,23 +1,55 @@
 import math
+import os
 
-from utils import Direction, ScoreType, GhostBehaviour, translate_to_maze, translate_to_screen
+from utils import Direction, ScoreType, GhostBehaviour, ChaseStrategy, translate_to_maze
 import pygame
-from world import GameElement
+from path import PathCursor, CellPath
+from fields import UNREACHED
+from gamestate import GameState
+from instrumentation import instruments
+from replan import ChasePlanner
+from world import GameElement, CELL_SIZE
 
 THRESHOLD_DISTANCE = 80
+# Asset paths are relative to the game, not to the working directory
+ROOT = os.path.dirname(os.path.abspath(__file__))
 
 
 class SpriteManager:
-    def __init__(self):
-        self.sprites = {
-            "pacman_open": pygame.image.load("assets/pacman_state_1.png"),
-            "pacman_closed": pygame.image.load("assets/pacman_state_2.png"),
-            "ghost_fright": pygame.image.load("assets/ghost_run_mode.png"),
-            "ghost": pygame.image.load('assets/ghost_1.png'),
+    def __init__(self, size: int = 32):
+        self.size = size
+        self.paths = {
+            "pacman_open": "assets/pacman_state_1.png",
+            "pacman_closed": "assets/pacman_state_2.png",
+            "ghost_fright": "assets/ghost_run_mode.png",
+            "ghost": "assets/ghost_1.png",
         }
+        # Source images by file, so every sprite that uses a file shares one surface. Nothing is loaded
+        # before the first frame is drawn, processes that never draw never read an image.
+        self.files = {}
+        # Scaled, rotated and converted frames, ready to blit
+        self.frames = {}
+
+    def load(self, path):
+        image = self.files.get(path)
+        if image is None:
+            image = self.files[path] = pygame.image.load(os.path.join(ROOT, path))
+        return image
 
     def get_sprite(self, sprite_name):
-        return self.sprites[sprite_name]
+        return self.load(self.paths[sprite_name])
+
+    def get_frame(self, sprite, angle: int = 0):
+        # sprite is a sprite name or an image path. Frames need a display for convert_alpha, so they are
+        # prepared on first use and then reused by every agent.
+        key = (sprite, angle)
+        frame = self.frames.get(key)
+        if frame is None:
+            image = self.load(self.paths.get(sprite, sprite))
+            if angle:
+                image = pygame.transform.rotate(image, angle)
+            frame = self.frames[key] = pygame.transform.scale(image, (self.size, self.size)).convert_alpha()
+        return frame
 
 
 sprite_manager = SpriteManager()
@@ -29,27 +61,46 @@ class Agent(GameElement):
         self.current_direction = Direction.NONE
         self.direction_buffer = Direction.NONE
         self.last_working_direction = Direction.NONE
-        self.location_queue = []
+        self.location_queue = PathCursor()
         self.next_target = None
-        self.image = sprite_manager.get_sprite('ghost')
 
     def get_next_location(self):
-        return None if len(self.location_queue) == 0 else self.location_queue.pop(0)
+        return self.location_queue.next()
+
+    def get_cell(self):
+        # Maze cell under the agent's centre
+        return translate_to_maze((self.x + self.size / 2, self.y + self.size / 2))
+
+    def set_new_path(self, in_path: CellPath):
+        self.location_queue = PathCursor(in_path)
+        self.next_target = self.get_next_location()
+
+    def skip_reached_targets(self):
+        # A pixel step spends a tick turning towards a target the agent already stands on, or asking for a
+        # path, which a cell step cannot afford: it would lose a whole cell. So whole cell steps pass over
+        # reached targets, and ask for the next path, within the step.
+        for _ in range(2):
+            while self.next_target == (self.x, self.y):
+                self.next_target = self.get_next_location()
+            if self.next_target is not None:
+                return
+            self.request_next_path()
+
+    def request_next_path(self):
+        pass
 
     def set_direction(self, direction):
         self.current_direction = direction
         self.direction_buffer = direction
 
     def collides_with_wall(self, position):
-        collision_rect = pygame.Rect(position[0], position[1], self.size, self.size)
-        collides = False
-        walls = self.world.get_walls()
-        for wall in walls:
-            collides = collision_rect.colliderect(wall.get_shape())
-            if collides: break
-        return collides
+        return self.world.collides_with_wall(position[0], position[1], self.size)
 
     def check_collision_in_direction(self, direction: Direction):
+        with instruments.phase("collision"):
+            return self.find_collision_in_direction(direction)
+
+    def find_collision_in_direction(self, direction: Direction):
         desired_position = (0, 0)
         if direction == Direction.NONE: return False, desired_position
         if direction == Direction.UP:
@@ -61,6 +112,13 @@ class Agent(GameElement):
         elif direction == Direction.RIGHT:
             desired_position = (self.x + 1, self.y)
 
+        grid = self.world.grid
+        if self.x % CELL_SIZE == 0 and self.y % CELL_SIZE == 0:
+            # Standing exactly on a cell, the legal move table has the answer
+            instruments.count("collision_checks")
+            cell = translate_to_maze((self.x, self.y))
+            return not grid.can_move(cell[0], cell[1], direction), desired_position
+
         return self.collides_with_wall(desired_position), desired_position
 
     def automatic_move(self, direction: Direction):
@@ -73,9 +131,11 @@ class Agent(GameElement):
     def reached_target(self):
         pass
 
-    def draw(self):
-        self.image = pygame.transform.scale(self.image, (32, 32))
-        self.screen.blit(self.image, self.get_shape())
+    def get_image(self):
+        return sprite_manager.get_frame("ghost")
+
+    def draw(self, alpha: float = 1.0):
+        return self.world.screen.blit(self.get_image(), self.get_render_position(alpha))
 
 
 class Pacman(Agent):
@@ -83,24 +143,24 @@ class Pacman(Agent):
     def __init__(self, screen, x, y, size: int, game_controller):
         super().__init__(screen, x, y, size, (255, 255, 0), False)
         self.game_controller = game_controller
-        self.last_non_colliding_position = (0, 0)
-        self.open = sprite_manager.get_sprite("pacman_open")
-        self.closed = sprite_manager.get_sprite("pacman_closed")
-        self.image = self.open
         self.current_direction = Direction.NONE
         self.mouth_open = True
+        self.spawn = (x, y)
+        # Set when something outside the game steers Pacman, he then only follows the paths he is given
+        self.controlled = False
 
     def tick(self):
-        self.last_non_colliding_position = self.get_position()
-
         if self.next_target is None or self.reached_target():
             self.request_best_path()
+        if self.world.step_ticks > 1:
+            self.skip_reached_targets()
 
-        # Once the new direction is calculated, move pacman in that direction
-        self.automatic_move(self.calculate_direction_to_next_target())
-
-        if self.collides_with_wall((self.x, self.y)):
-            self.set_position(self.last_non_colliding_position[0], self.last_non_colliding_position[1])
+        # Once the new direction is calculated, move pacman in that direction unless a wall is in the way
+        direction = self.calculate_direction_to_next_target()
+        if self.check_collision_in_direction(direction)[0]:
+            self.current_direction = direction
+        else:
+            self.automatic_move(direction)
 
         self.handle_cookie_pickup()
         self.handle_ghosts()
@@ -113,46 +173,28 @@ class Pacman(Agent):
     # Move to the desired direction
     def automatic_move(self, in_direction: Direction):
         self.current_direction = in_direction
+        step = self.world.step_ticks
         if in_direction == Direction.UP:
-            self.set_position(self.x, self.y - 1)
+            self.set_position(self.x, self.y - step)
         elif in_direction == Direction.DOWN:
-            self.set_position(self.x, self.y + 1)
+            self.set_position(self.x, self.y + step)
         elif in_direction == Direction.LEFT:
-            self.set_position(self.x - 1, self.y)
+            self.set_position(self.x - step, self.y)
         elif in_direction == Direction.RIGHT:
-            self.set_position(self.x + 1, self.y)
+            self.set_position(self.x + step, self.y)
 
     def handle_cookie_pickup(self):
-        collision_rect = pygame.Rect(self.x, self.y, self.size, self.size)
-        cookies = self.world.get_cookies()
-        powerups = self.world.get_powerups()
-        game_objects = self.world.get_game_objects()
-        cookie_to_remove = None
-        for cookie in cookies:
-            collides = collision_rect.colliderect(cookie.get_shape())
-            if collides and cookie in game_objects:
-                game_objects.remove(cookie)
-                self.world.add_score(ScoreType.DOT)
-                cookie_to_remove = cookie
-
-        if cookie_to_remove is not None:
-            cookies.remove(cookie_to_remove)
-
-        if len(self.world.get_cookies()) == 0:
+        # Whatever lies in the cell under pacman's centre is picked up
+        cell = self.get_cell()
+        if self.world.take_cookie(cell):
+            self.world.add_score(ScoreType.DOT)
+
+        if self.world.get_pickups().dot_count == 0:
             self.world.set_won()
 
-        for powerup in powerups:
-            collides = collision_rect.colliderect(powerup.get_shape())
-            if collides and powerup in game_objects:
-                if not self.world.is_power_active():
-                    game_objects.remove(powerup)
-                    self.world.add_score(ScoreType.POWERUP)
-                    self.world.activate_power()
-
-    def set_new_path(self, in_path):
-        for item in in_path:
-            self.location_queue.append(item)
-        self.next_target = self.get_next_location()
+        if not self.world.is_power_active() and self.world.take_powerup(cell):
+            self.world.add_score(ScoreType.POWERUP)
+            self.world.activate_power()
 
     def calculate_direction_to_next_target(self) -> Direction:
         if self.next_target is None:
@@ -173,79 +215,80 @@ class Pacman(Agent):
         self.request_best_path()
         return Direction.NONE
 
-    def get_nearest(self, objects, current_position):
-        nearest_object = None
-        min_distance = math.inf
-
-        for obj in objects:
-            obj_position = obj.get_position()
-            distance = self.calculate_distance(current_position, obj_position)
-
-            if distance < min_distance:
-                min_distance = distance
-                nearest_object = obj
-
-        return nearest_object
-
-    def calculate_distance(self, pos1, pos2):
-        return math.sqrt((pos1[0] - pos2[0]) ** 2 + (pos1[1] - pos2[1]) ** 2)
-
-    def move_away_from_ghost(self, current_position, ghost_position):
-        dx, dy = current_position[0] - ghost_position[0], current_position[1] - ghost_position[1]
-        new_target = (current_position[0] + dx, current_position[1] + dy)
-
-        # Keep the new target within the boundaries of the game.
-        new_target = (max(0, min(self.world.width, new_target[0])),
-                      max(0, min(self.world.height, new_target[1])))
-
-        return new_target
+    def request_next_path(self):
+        self.request_best_path()
 
     def request_best_path(self):
-        current_position = self.get_position()
-        nearest_cookie = self.get_nearest(self.world.get_cookies(), current_position)
-        nearest_powerup = self.get_nearest(self.world.get_powerups(), current_position)
-        nearest_ghost = self.get_nearest(self.world.get_ghosts(), current_position)
-
-        cookie_distance = self.calculate_distance(current_position, nearest_cookie.get_position())
-        powerup_distance = self.calculate_distance(current_position, nearest_powerup.get_position())
-        ghost_distance = 0 if nearest_ghost is None else self.calculate_distance(current_position,
-                                                                                 nearest_ghost.get_position())
-        ghost_nearby = nearest_ghost and ghost_distance <= THRESHOLD_DISTANCE
+        with instruments.phase("pathfinding"):
+            self.choose_best_path()
+
+    def choose_best_path(self):
+        if self.controlled:
+            return
+        if self.game_controller.lookahead is not None:
+            self.choose_lookahead_move()
+            return
+        # Every decision is read off BFS distance fields over the maze, and the chosen path is the walk
+        # down (or up, when fleeing) the matching field, so no path search is needed.
+        fields = self.game_controller.fields
+        grid = fields.grid
+        pickups = self.world.get_pickups()
+        current = grid.index(*self.get_cell())
+
+        cookie_field = fields.dot_field(pickups)
+        if cookie_field.distance(current) == UNREACHED:  # Nothing left to eat
+            return
+        powerup_field = fields.powerup_field(pickups)
+        ghost_field = fields.ghost_field(grid.index(*ghost.get_cell()) for ghost in self.world.get_ghosts())
+
+        powerup_distance = self.field_distance(powerup_field, current)
+        ghost_distance = self.field_distance(ghost_field, current)
+        ghost_nearby = ghost_distance <= THRESHOLD_DISTANCE
 
         # If power is active or a powerup is close and there are ghosts nearby, we should go for it.
         if self.world.is_power_active() or (ghost_nearby and powerup_distance < THRESHOLD_DISTANCE):
-            if nearest_ghost is not None:
-                best_target = nearest_ghost.get_position()
-            elif nearest_powerup is not None:
-                best_target = nearest_powerup.get_position()
+            if ghost_distance != math.inf:
+                path = ghost_field.descend(current)
+            elif powerup_distance != math.inf:
+                path = powerup_field.descend(current)
             else:  # If all ghosts are eaten or no ghosts nearby, go for the nearest cookie
-                best_target = nearest_cookie.get_position()
+                path = cookie_field.descend(current)
         else:  # If power is not active
-            if ghost_nearby:  # If ghost is near
-                best_target = self.move_away_from_ghost(current_position, nearest_ghost.get_position())
-            else:  # If ghost is not near, we chase the nearest cookie.
-                best_target = nearest_cookie.get_position()
-
-        # Now that we have our target, we request the path.
-        target_position = translate_to_maze(best_target)
-        current_maze_coord = translate_to_maze(current_position)
-        path = self.game_controller.p.get_path(current_maze_coord[0], current_maze_coord[1], target_position[0],
-                                               target_position[1])
-        if path is None:
-            print('No Path Found')
-        else:
-            new_path = [translate_to_screen(item) for item in path]
-            self.set_new_path(new_path)
+            path = None
+            if ghost_nearby:  # If ghost is near, run uphill in the ghost field
+                path = ghost_field.ascend(current, THRESHOLD_DISTANCE // self.size + 2)
+            if path is None or len(path) < 2:  # If ghost is not near (or we are cornered), chase the nearest cookie.
+                path = cookie_field.descend(current)
+
+        fields.paths_served += 1
+        self.set_new_path(CellPath([grid.coordinates(index) for index in path]))
+
+    def choose_lookahead_move(self):
+        fields = self.game_controller.fields
+        grid = fields.grid
+        move = self.game_controller.lookahead.choose(GameState.from_world(self.world),
+                                                     fields.dot_field(self.world.get_pickups()))
+        if move is not None:
+            # Just the next cell, the next decision is taken on arrival
+            self.set_new_path(CellPath((grid.coordinates(move),)))
+
+    def field_distance(self, field, index):
+        # Maze distance in pixels, so it compares with THRESHOLD_DISTANCE like the old straight-line one
+        distance = field.distance(index)
+        return math.inf if distance == UNREACHED else distance * self.size
 
     def handle_ghosts(self):
         collision_rect = pygame.Rect(self.x, self.y, self.size, self.size)
         ghosts = self.world.get_ghosts()
         game_objects = self.world.get_game_objects()
-        for ghost in ghosts:
-            collides = collision_rect.colliderect(ghost.get_shape())
+        for ghost in list(ghosts):
+            # A whole cell a step, Pacman and a ghost can swap cells without ever overlapping
+            collides = collision_rect.colliderect(ghost.get_shape()) or (
+                (ghost.x, ghost.y) == (self.previous_x, self.previous_y) and
+                (ghost.previous_x, ghost.previous_y) == (self.x, self.y))
             if collides and ghost in game_objects:
                 if self.world.is_power_active():
-                    game_objects.remove(ghost)
+                    self.world.remove_ghost(ghost)
                     self.world.add_score(ScoreType.GHOST)
                 else:
                     if not self.world.get_won():
@@ -264,36 +307,43 @@ class Pacman(Agent):
         else:  # Direction.NONE
             return 0  # or any other default angle
 
-    def draw(self):
-        self.image = self.open if self.mouth_open else self.closed
-        self.image = pygame.transform.rotate(self.image, self.direction_to_angle(self.current_direction))
-        super(Pacman, self).draw()
+    def get_image(self):
+        sprite = "pacman_open" if self.mouth_open else "pacman_closed"
+        return sprite_manager.get_frame(sprite, self.direction_to_angle(self.current_direction))
 
 
 class Ghost(Agent):
     def __init__(self, screen, x, y, size: int, game_controller, sprite_path="assets/ghost_1.png"):
         super().__init__(screen, x, y, size)
         self.game_controller = game_controller
-        self.sprite_normal = pygame.image.load(sprite_path)
-        self.sprite_fright = sprite_manager.get_sprite("ghost_fright")
+        self.sprite_path = sprite_path
+        # Only used with ChaseStrategy.INCREMENTAL, created on the first chase
+        self.chase_planner = None
+        # The last path the chase planner handed the ghost, to tell it apart from patrol paths
+        self.chase_path = None
 
     def reached_target(self):
+        if self.x % CELL_SIZE == 0 and self.y % CELL_SIZE == 0:
+            # A path planned off the game loop is only taken on at a cell, where the ghost can turn
+            self.game_controller.collect_path(self)
         if (self.x, self.y) == self.next_target:
             self.next_target = self.get_next_location()
+            if self.game_controller.chase_strategy != ChaseStrategy.ASTAR and self.is_chasing():
+                # Every cell is a chance to follow Pacman if he has moved since the path was planned
+                self.request_path_to_player(self)
+        if self.world.step_ticks > 1:
+            self.skip_reached_targets()
         self.current_direction = self.calculate_direction_to_next_target()
+        if self.current_direction != Direction.NONE:
+            self.last_working_direction = self.current_direction
 
-    def set_new_path(self, in_path):
-        for item in in_path:
-            self.location_queue.append(item)
-        self.next_target = self.get_next_location()
+    def is_chasing(self):
+        return self.world.get_current_mode() == GhostBehaviour.CHASE and not self.world.is_power_active()
 
     def calculate_direction_to_next_target(self) -> Direction:
         if self.next_target is None:
-            if self.world.get_current_mode() == GhostBehaviour.CHASE and not self.world.is_power_active():
-                self.request_path_to_player(self)
-            else:
-                self.game_controller.request_new_random_path(self)
-            return Direction.NONE
+            self.request_new_path()
+            return self.waiting_direction()
 
         diff_x = self.next_target[0] - self.x
         diff_y = self.next_target[1] - self.y
@@ -302,33 +352,81 @@ class Ghost(Agent):
         if diff_y == 0:
             return Direction.LEFT if diff_x < 0 else Direction.RIGHT
 
-        if self.world.get_current_mode() == GhostBehaviour.CHASE and not self.world.is_power_active():
+        self.request_new_path()
+        return Direction.NONE
+
+    def waiting_direction(self) -> Direction:
+        # While the path scheduler holds its request back, the ghost keeps going the way it last moved for
+        # as long as the maze lets it. The tick its path ran out it stood, so current_direction is NONE.
+        direction = self.last_working_direction
+        if direction == Direction.NONE or not self.game_controller.is_deferred(self):
+            return Direction.NONE
+        if self.x % CELL_SIZE or self.y % CELL_SIZE:
+            return direction
+        x, y = translate_to_maze(self.get_position())
+        return direction if self.world.grid.can_move(x, y, direction) else Direction.NONE
+
+    def request_next_path(self):
+        self.request_new_path()
+
+    def request_new_path(self):
+        if self.is_chasing():
             self.request_path_to_player(self)
-        else:
+        elif not self.game_controller.is_planning(self):
+            # Any random destination will do, so one that is still being planned is not asked for again
             self.game_controller.request_new_random_path(self)
-        return Direction.NONE
 
     def request_path_to_player(self, in_ghost):
+        if self.game_controller.chase_strategy == ChaseStrategy.INCREMENTAL:
+            in_ghost.refresh_chase_path()
+            return
+        if self.game_controller.chase_strategy == ChaseStrategy.FLOW_FIELD:
+            in_ghost.follow_flow_field()
+            return
+
         player_position = translate_to_maze(in_ghost.world.get_pacman_position())
         current_maze_coord = translate_to_maze(in_ghost.get_position())
-        path = self.game_controller.p.get_path(current_maze_coord[0], current_maze_coord[1], player_position[0],
-                                               player_position[1])
-        if path is None:
-            print('No Path Found')
-        else:
-            new_path = [translate_to_screen(item) for item in path]
-            in_ghost.set_new_path(new_path)
+        self.game_controller.request_path(in_ghost, current_maze_coord, player_position)
+
+    def refresh_chase_path(self):
+        grid = self.game_controller.p.grid
+        if self.chase_planner is None:
+            self.chase_planner = ChasePlanner(grid, self.game_controller.p.search)
+        goal = grid.index(*translate_to_maze(self.world.get_pacman_position()))
+        # Only the planner's own path is still good for the same goal, not a patrol path taken since
+        following = self.next_target is not None and self.location_queue.path is self.chase_path
+        if goal == self.chase_planner.goal and following:
+            return
+
+        with instruments.phase("pathfinding"):
+            path = self.chase_planner.plan(grid.index(*translate_to_maze(self.get_position())), goal)
+        # Like Path.get_path, an unreachable Pacman (he is gone once the game is over) leaves the ghost standing
+        if path is not None:
+            # The path starts on the ghost's own cell, which it has already reached
+            self.chase_path = CellPath([grid.coordinates(index) for index in path[1:]])
+            self.set_new_path(self.chase_path)
+
+    def follow_flow_field(self):
+        # One step downhill in the field every chasing ghost shares, it is only rebuilt when Pacman
+        # changes cell
+        grid = self.game_controller.p.grid
+        pacman_cell = grid.index(*translate_to_maze(self.world.get_pacman_position()))
+        with instruments.phase("pathfinding"):
+            field = self.game_controller.fields.pacman_field(pacman_cell)
+            step = field.step(grid.index(*translate_to_maze(self.get_position())))
+        if step is not None:
+            self.set_new_path(CellPath((grid.coordinates(step),)))
 
     def automatic_move(self, in_direction: Direction):
+        step = self.world.step_ticks
         if in_direction == Direction.UP:
-            self.set_position(self.x, self.y - 1)
+            self.set_position(self.x, self.y - step)
         elif in_direction == Direction.DOWN:
-            self.set_position(self.x, self.y + 1)
+            self.set_position(self.x, self.y + step)
         elif in_direction == Direction.LEFT:
-            self.set_position(self.x - 1, self.y)
+            self.set_position(self.x - step, self.y)
         elif in_direction == Direction.RIGHT:
-            self.set_position(self.x + 1, self.y)
+            self.set_position(self.x + step, self.y)
 
-    def draw(self):
-        self.image = self.sprite_fright if self.world.is_power_active() else self.sprite_normal
-        super(Ghost, self).draw()
+    def get_image(self):
+        return sprite_manager.get_frame("ghost_fright" if self.world.is_power_active() else self.sprite_path)
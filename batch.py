@@ -0,0 +1,102 @@
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Every worker imports pygame, keep its banner from being printed once per process
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import agent
+from main import create_game
+
+FPS = 120
+
+
+def play_game(seed, max_ticks):
+    pacman_game, world = create_game(headless=True, seed=seed)
+    world.tick(FPS, max_ticks)
+    return {
+        "seed": seed,
+        "score": world.score,
+        "lives": world.lives,
+        "won": world.won,
+        "ticks": world.ticks,
+        "path_calls": pacman_game.p.calls,
+        "path_cache_hits": pacman_game.p.hits,
+        "field_paths": pacman_game.fields.paths_served,
+    }
+
+
+def run_chunk(seeds, max_ticks, threshold):
+    # Runs inside a worker process, so module level tuning only affects this worker
+    if threshold is not None:
+        agent.THRESHOLD_DISTANCE = threshold
+    return [play_game(seed, max_ticks) for seed in seeds]
+
+
+def make_chunks(seeds, chunk_size):
+    return [seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)]
+
+
+def summarize(results, elapsed):
+    summary = {"games": len(results), "elapsed": elapsed, "games_per_second": len(results) / elapsed}
+    for key in ("score", "lives", "ticks", "path_calls", "field_paths"):
+        values = np.array([result[key] for result in results], dtype=np.float64)
+        p5, p50, p95 = np.percentile(values, [5, 50, 95])
+        summary[key] = {"mean": float(values.mean()), "p5": float(p5), "p50": float(p50), "p95": float(p95)}
+    summary["win_rate"] = sum(result["won"] for result in results) / len(results)
+    # Share of path requests answered by the distance fields instead of a search
+    searches = sum(result["path_calls"] for result in results)
+    served = sum(result["field_paths"] for result in results)
+    summary["searches_saved"] = served / max(1, searches + served)
+    return summary
+
+
+def run_batch(games, workers, chunk_size, first_seed, max_ticks, threshold):
+    seeds = list(range(first_seed, first_seed + games))
+    if chunk_size is None:
+        # A few chunks per worker keeps every core busy without paying for one task per game
+        chunk_size = max(1, math.ceil(games / (workers * 4)))
+    chunks = make_chunks(seeds, chunk_size)
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_chunk, chunk, max_ticks, threshold) for chunk in chunks]
+        for future in futures:
+            results.extend(future.result())
+    elapsed = time.perf_counter() - started
+    return results, summarize(results, elapsed)
+
+
+def print_summary(summary):
+    print(f"{summary['games']} games in {summary['elapsed']:.2f}s ({summary['games_per_second']:.2f} games/s)")
+    print(f"win rate: {summary['win_rate'] * 100:.1f}%")
+    print(f"path requests served by distance fields: {summary['searches_saved'] * 100:.1f}%")
+    for key in ("score", "lives", "ticks", "path_calls", "field_paths"):
+        stats = summary[key]
+        print(f"{key:>10}: mean {stats['mean']:.1f}  p5 {stats['p5']:.1f}  p50 {stats['p50']:.1f}  "
+              f"p95 {stats['p95']:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run seeded headless games in parallel and report aggregates")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game, the others count up from it")
+    parser.add_argument("--max-ticks", type=int, default=FPS * 300, help="stop games that run longer than this")
+    parser.add_argument("--threshold", type=int, default=None, help="override agent.THRESHOLD_DISTANCE")
+    parser.add_argument("--output", default=None, help="write per-game results and the summary as JSON")
+    args = parser.parse_args()
+
+    results, summary = run_batch(args.games, args.workers, args.chunk_size, args.seed, args.max_ticks,
+                                 args.threshold)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "games": results}, f, indent=2)
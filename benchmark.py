@@ -0,0 +1,849 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+# Rendering benchmarks draw to an offscreen surface, no window is needed
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from env import ACTIONS, PacmanEnv, VectorEnv
+from gamestate import GameState, LookaheadPolicy
+from grid import MazeGrid
+from junction import JunctionGraph
+from fields import DistanceField
+from agent import Ghost
+from main import GameEngine, create_game
+from maze import compile_maze, decode_maze, generate_maze
+from node import astar
+from path import Path, CellPath
+from pickups import PickupGrid, DOT
+from routing import RoutingTable
+from search import GridAStar
+from utils import PathMode, ChaseStrategy, GhostBehaviour
+from world import World, CELL_SIZE as WORLD_CELL_SIZE
+from vector_sim import VectorSimulation, CELL_SIZE, DIRECTION_X, DIRECTION_Y
+
+
+def tile_maze(maze, factor):
+    # Repeat the maze factor x factor times and open a gap in every seam so the copies connect.
+    maze = np.asarray(maze, dtype=np.uint8)
+    height, width = maze.shape
+    tiled = np.tile(maze, (factor, factor))
+
+    for seam in range(1, factor):
+        column = seam * width
+        for row in range(tiled.shape[0]):
+            if tiled[row, column - 2] and tiled[row, column + 1]:
+                tiled[row, column - 1] = tiled[row, column] = 1
+
+        row = seam * height
+        for column in range(tiled.shape[1]):
+            if tiled[row - 2, column] and tiled[row + 1, column]:
+                tiled[row - 1, column] = tiled[row, column] = 1
+
+    return tiled.tolist()
+
+
+def sample_queries(maze, count, seed):
+    rng = random.Random(seed)
+    spaces = [(x, y) for y, row in enumerate(maze) for x, value in enumerate(row) if value]
+    return [(rng.choice(spaces), rng.choice(spaces)) for _ in range(count)]
+
+
+def time_legacy(maze, queries):
+    lengths = []
+    started = time.perf_counter()
+    for (from_x, from_y), (to_x, to_y) in queries:
+        res = astar(maze, (from_y, from_x), (to_y, to_x))
+        lengths.append(0 if res is None else len(res))
+    return time.perf_counter() - started, lengths
+
+
+def time_engine(maze, queries, mode=PathMode.SEARCH):
+    p = Path(maze, mode)
+    lengths = []
+    started = time.perf_counter()
+    for (from_x, from_y), (to_x, to_y) in queries:
+        lengths.append(len(p.get_path(from_x, from_y, to_x, to_y)))
+    return time.perf_counter() - started, lengths
+
+
+def run_pathfinding(factors, count, legacy_limit, seed):
+    base = GameEngine().numpy_maze
+    print(f"{'maze':>10} {'cells':>8} {'queries':>8} {'legacy ms':>10} {'engine ms':>10} {'speedup':>8}")
+    for factor in factors:
+        maze = tile_maze(base, factor)
+        queries = sample_queries(maze, count, seed)
+        engine_time, engine_lengths = time_engine(maze, queries)
+        engine_ms = engine_time * 1000 / count
+
+        legacy = "-"
+        speedup = "-"
+        if len(maze) * len(maze[0]) <= legacy_limit:
+            legacy_time, legacy_lengths = time_legacy(maze, queries)
+            # The old squared-Euclidean heuristic is not admissible, so it can only ever be longer
+            if any(new > old for new, old in zip(engine_lengths, legacy_lengths)):
+                raise AssertionError("Engine returned a longer path than node.astar")
+            legacy_ms = legacy_time * 1000 / count
+            legacy = f"{legacy_ms:.3f}"
+            speedup = f"{legacy_ms / engine_ms:.1f}x"
+
+        size = f"{len(maze[0])}x{len(maze)}"
+        print(f"{size:>10} {len(maze) * len(maze[0]):>8} {count:>8} {legacy:>10} {engine_ms:>10.3f} {speedup:>8}")
+
+
+def run_routing(factors, count, seed):
+    base = GameEngine().numpy_maze
+    print(f"{'maze':>10} {'cells':>8} {'build s':>9} {'table MB':>9} {'search ms':>10} {'table ms':>9}")
+    for factor in factors:
+        maze = tile_maze(base, factor)
+        open_cells = int(np.count_nonzero(maze))
+        size = f"{len(maze[0])}x{len(maze)}"
+        if open_cells > RoutingTable.MAX_CELLS:
+            print(f"{size:>10} {open_cells:>8} too many cells for a routing table")
+            continue
+
+        queries = sample_queries(maze, count, seed)
+        p = Path(maze, PathMode.TABLE)
+        table = p.routing
+        search_time, search_lengths = time_engine(maze, queries)
+        started = time.perf_counter()
+        table_lengths = [len(p.get_path(fx, fy, tx, ty)) for (fx, fy), (tx, ty) in queries]
+        table_time = time.perf_counter() - started
+        if table_lengths != search_lengths:
+            raise AssertionError("Routing table and A* disagree on path lengths")
+
+        print(f"{size:>10} {open_cells:>8} {table.build_time:>9.3f} {table.nbytes / 2 ** 20:>9.2f} "
+              f"{search_time * 1000 / count:>10.3f} {table_time * 1000 / count:>9.3f}")
+
+
+def random_route(maze, start, length, seed):
+    # Random walk that avoids turning back unless it has to
+    rng = random.Random(seed)
+    route = [start]
+    previous = None
+    while len(route) < length:
+        x, y = route[-1]
+        options = [(x + dx, y + dy) for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)) if maze[y + dy][x + dx]]
+        forward = [cell for cell in options if cell != previous] or options
+        previous = route[-1]
+        route.append(rng.choice(forward))
+    return route
+
+
+def route_actions(route):
+    actions = []
+    for (x, y), (next_x, next_y) in zip(route, route[1:]):
+        dx, dy = next_x - x, next_y - y
+        actions.append(next(code for code in range(1, 5) if DIRECTION_X[code] == dx and DIRECTION_Y[code] == dy))
+    return actions
+
+
+def powered_positions(route, powerups, power_cells):
+    # Whether Pacman has power at each position of route, walking it from its start
+    left = set(powerups)
+    powered = []
+    until = -1
+    for position, cell in enumerate(route):
+        if position > until and cell in left:
+            left.discard(cell)
+            until = position + power_cells
+        powered.append(position <= until)
+    return powered
+
+
+def meeting_route(pacman_game, start, route, meet, ahead=4):
+    # A ghost route that runs into Pacman head on at route[meet]: the ghost paces between start and a
+    # neighbour, then goes to route[meet + ahead], arriving there ahead cells before him, and walks his
+    # route back. Also returns the position Pacman is at when the ghost sets off; (None, None) when the
+    # ghost cannot make it in time.
+    grid = pacman_game.p.grid
+    pacing = (start, grid.coordinates(grid.neighbours(grid.index(*start))[0]))
+    far = meet + ahead
+    if far >= len(route):
+        return None, None
+    # Pacing an even number of cells ends on start, an odd number on the neighbour. When the parity of the
+    # maze rules out meeting on a cell the ghost sets off one cell earlier and they meet between two cells.
+    way = list(pacman_game.p.get_path(*start, *route[far]))
+    departure = 2 * meet - far - (len(way) - 1)
+    if departure % 2:
+        departure -= 1
+    if departure < 0:
+        return None, None
+    return [pacing[i % 2] for i in range(departure)] + way + route[far - 1::-1], departure
+
+
+def check_vector_consistency(length, seed, ghosts=True, fps=120):
+    # Drives Pacman along the same scripted route in both engines and compares every tick: ghost mode,
+    # the ticks left of the mode and power timers, score, remaining dots, lives and where Pacman and the
+    # ghosts are. The route starts with the way to the nearest powerup, so a power period is covered.
+    # With ghosts, two of them follow scripted routes that run into Pacman, the first while he is powered
+    # and the second once his power is gone, and the check ends with the life he loses. Without, Pacman
+    # walks the whole route alone.
+    pacman_game, world = create_game(headless=True, seed=seed)
+    spawn = tuple(pacman_game.pacman_spawn)
+    to_powerup = min((list(pacman_game.p.get_path(*spawn, *cell)) for cell in pacman_game.powerup_spaces), key=len)
+    route = to_powerup + random_route(pacman_game.numpy_maze, to_powerup[-1], length, seed)[1:]
+    powered_at = len(to_powerup) - 1
+    power_cells = world.scheduler.to_ticks(15000) // CELL_SIZE
+
+    kept = 2 if ghosts else 0
+    for ghost in world.get_ghosts()[kept:]:
+        world.remove_ghost(ghost)
+    scripted = world.get_ghosts()[:]
+    spawns = pacman_game.ghost_spawns[:kept]
+    # The first ghost sets off and meets Pacman while he has power, the second while he has none
+    powered = powered_positions(route, pacman_game.powerup_spaces, power_cells)
+    ghost_routes = []
+    for ghost_spawn, wanted in zip(spawns, (True, False)):
+        for meet in range(powered_at, len(route) - 8):
+            ghost_route, departure = meeting_route(pacman_game, ghost_spawn, route, meet)
+            if ghost_route is not None and all(powered[position] == wanted for position in range(departure, meet + 8)):
+                ghost_routes.append(ghost_route)
+                break
+        else:
+            state = "with" if wanted else "without"
+            raise AssertionError(f"Pacman's route leaves no time for a ghost to meet him {state} power")
+    for ghost, ghost_route in zip(scripted, ghost_routes):
+        ghost.set_new_path(CellPath(ghost_route))
+    world.scheduler.fps = fps
+    world.handle_mode_switch()
+    world.pacman.set_new_path(CellPath(route))
+
+    simulation = VectorSimulation(pacman_game.numpy_maze, pacman_game.dot_spaces, pacman_game.powerup_spaces, spawns,
+                                  1, pacman_spawn=spawn, fps=fps, seed=seed)
+    actions = route_actions(route)
+    ghost_actions = [route_actions(ghost_route) for ghost_route in ghost_routes]
+    powered_ticks = 0
+    lives = world.lives
+    for cell, action in enumerate(actions):
+        moves = [[moves[cell] if cell < len(moves) else 0 for moves in ghost_actions]]
+        for _ in range(CELL_SIZE):
+            world.step()
+            world.handle_scheduled_events()
+            simulation.step([action], moves)
+
+            power = world.power_end_tick - world.ticks if world.is_power_active() else 0
+            powered_ticks += power > 0
+            alive = world.get_ghosts()
+            expected = (world.get_current_mode().value, world.scheduler.remaining(world.mode_switch_event), power,
+                        world.score, world.get_pickups().dot_count, world.lives, world.pacman.get_position(),
+                        [ghost.get_position() if ghost in alive else None for ghost in scripted])
+            x, y = simulation.pixel_positions(simulation.pacman_cell, simulation.pacman_offset,
+                                              simulation.pacman_direction)
+            ghost_x, ghost_y = simulation.pixel_positions(simulation.ghost_cell[0], simulation.ghost_offset[0],
+                                                          simulation.ghost_direction[0])
+            actual = (int(simulation.ghost_mode[0]), int(simulation.mode_timer[0]), int(simulation.power_timer[0]),
+                      int(simulation.score[0]), int(simulation.dots_left[0]), int(simulation.lives[0]),
+                      (int(x[0]), int(y[0])),
+                      [(int(gx), int(gy)) if simulation.ghost_alive[0, i] else None
+                       for i, (gx, gy) in enumerate(zip(ghost_x, ghost_y))])
+            if expected != actual:
+                raise AssertionError(f"Engines diverged at tick {world.ticks}: object {expected}, vector {actual}")
+            if world.lives < lives:
+                break
+        if world.lives < lives:
+            break
+
+    if not powered_ticks:
+        raise AssertionError("The route never powered Pacman up")
+    eaten = len(scripted) - len(world.get_ghosts())
+    if ghosts and (eaten != 1 or world.lives != lives - 1):
+        raise AssertionError(f"The scripted ghosts were meant to be eaten once and to catch Pacman once, "
+                             f"{eaten} were eaten and {lives - world.lives} lives lost")
+    print(f"Vector engine matches the object engine over {world.ticks} ticks ({powered_ticks} powered, "
+          f"{eaten} ghosts eaten, {lives - world.lives} lives lost)")
+
+
+def run_vector(batches, steps, seed):
+    pacman_game = GameEngine()
+    print(f"{'games':>8} {'steps/s':>10} {'game steps/s':>14}")
+    for batch in batches:
+        simulation = VectorSimulation.from_engine(pacman_game, batch, seed=seed)
+        started = time.perf_counter()
+        for _ in range(steps):
+            simulation.step()
+        elapsed = time.perf_counter() - started
+        print(f"{batch:>8} {steps / elapsed:>10.0f} {steps * batch / elapsed:>14.0f}")
+
+
+def best_rate(function, operations, repeat):
+    # Best of several runs, the least disturbed one is the most reproducible
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return operations / best
+
+
+def bench_astar(maze, count, seed, repeat):
+    grid = MazeGrid(maze)
+    engine = GridAStar(grid)
+    queries = [(grid.index(*start), grid.index(*goal)) for start, goal in sample_queries(maze, count, seed)]
+
+    def run():
+        for start, goal in queries:
+            engine.search(start, goal)
+    return best_rate(run, count, repeat)
+
+
+def bench_legacy_astar(maze, count, seed, repeat):
+    queries = sample_queries(maze, count, seed)
+    return best_rate(lambda: time_legacy(maze, queries), count, repeat)
+
+
+def bench_collision(maze, count, seed, repeat):
+    world = World(MazeGrid(maze), headless=True)
+    rng = random.Random(seed)
+    positions = [(rng.randrange(world.width), rng.randrange(world.height)) for _ in range(count)]
+
+    def run():
+        for x, y in positions:
+            world.collides_with_wall(x, y, WORLD_CELL_SIZE)
+    return best_rate(run, count, repeat)
+
+
+def bench_pickup(maze, repeat):
+    grid = MazeGrid(maze)
+    cells = [grid.coordinates(index) for index in grid.open_indices()]
+    pickups = PickupGrid(grid)
+
+    def run():
+        for x, y in cells:
+            pickups.add(x, y, DOT)
+        for x, y in cells:
+            pickups.take(x, y, DOT)
+    # Every cell is filled and emptied again, count both
+    return best_rate(run, len(cells) * 2, repeat)
+
+
+def bench_headless(games, max_ticks, repeat):
+    ticks = 0
+
+    def run():
+        nonlocal ticks
+        ticks = 0
+        for seed in range(games):
+            _, world = create_game(headless=True, seed=seed)
+            world.tick(120, max_ticks)
+            ticks += world.ticks
+    rate = best_rate(run, 1, repeat)
+    return rate * ticks
+
+
+def bench_render(frames, repeat):
+    def run():
+        _, world = create_game(seed=0)
+        for _ in range(frames):
+            world.step()
+            world.render()
+            world.handle_events()
+    return best_rate(run, frames, repeat)
+
+
+def run_suite(factors, repeat, seed):
+    base = GameEngine().numpy_maze
+    results = {}
+
+    def record(name, value, unit):
+        results[name] = {"value": value, "unit": unit}
+        print(f"{name:>36} {value:>14.1f} {unit}")
+
+    record("astar_legacy/builtin", bench_legacy_astar(base, 200, seed, repeat), "queries/s")
+    for factor in factors:
+        maze = tile_maze(base, factor)
+        size = f"{len(maze[0])}x{len(maze)}"
+        record(f"astar/{size}", bench_astar(maze, 200, seed, repeat), "queries/s")
+        record(f"collision/{size}", bench_collision(maze, 20000, seed, repeat), "checks/s")
+        record(f"pickup/{size}", bench_pickup(maze, repeat), "ops/s")
+    record("headless/builtin", bench_headless(5, 120 * 120, repeat), "ticks/s")
+    record("render/builtin", bench_render(600, repeat), "frames/s")
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Every benchmark is a rate, so a drop of more than threshold is a regression
+    regressions = []
+    print(f"{'benchmark':>36} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["value"]
+        change = result["value"] / before - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:>36} {before:>14.1f} {result['value']:>14.1f} {change * 100:>7.1f}%{flag}")
+    return regressions
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def run_scaling(sizes, queries, ticks, seed):
+    # How every subsystem scales with maze size, on generated mazes
+    print(f"{'maze':>11} {'generate s':>10} {'text s':>7} {'binary s':>8} {'grid s':>7} {'astar ms':>9} "
+          f"{'field s':>8} {'setup s':>8} {'ticks/s':>8}")
+    for size in sizes:
+        generate_time, maze = timed(lambda: generate_maze(size, size, seed))
+        lines = maze.to_lines()
+        text_time, _ = timed(lambda: compile_maze(lines))
+        data = maze.to_bytes()
+        binary_time, _ = timed(lambda: decode_maze(data))
+        grid_time, grid = timed(lambda: MazeGrid(maze.open))
+
+        engine = GridAStar(grid)
+        pairs = [(grid.index(*start), grid.index(*goal)) for start, goal in sample_queries(maze.open, queries, seed)]
+        astar_time, _ = timed(lambda: [engine.search(start, goal) for start, goal in pairs])
+        field_time, _ = timed(lambda: DistanceField(grid).build([grid.index(*maze.pacman_spawn)]))
+
+        setup_time, (_, world) = timed(lambda: create_game(headless=True, seed=seed, maze=maze))
+        tick_time, _ = timed(lambda: world.tick(120, ticks))
+        print(f"{size:>5}x{size:<5} {generate_time:>10.3f} {text_time:>7.3f} {binary_time:>8.3f} {grid_time:>7.3f} "
+              f"{astar_time * 1000 / queries:>9.3f} {field_time:>8.3f} {setup_time:>8.3f} "
+              f"{world.ticks / tick_time:>8.0f}")
+
+
+def run_junction(sizes, queries, landmarks, seed):
+    # Cell A* against A* over the junction graph on generated mazes, same queries for both
+    print(f"{'maze':>11} {'cells':>8} {'junctions':>9} {'build s':>8} {'cell exp':>9} {'cell ms':>8} "
+          f"{'junc exp':>9} {'junc ms':>8} {'exp ratio':>9} {'speedup':>8}")
+    for size in sizes:
+        maze = generate_maze(size, size, seed)
+        grid = MazeGrid(maze.open)
+        cells = GridAStar(grid)
+        build_time, junctions = timed(lambda: JunctionGraph(grid, landmarks))
+        pairs = [(grid.index(*start), grid.index(*goal)) for start, goal in sample_queries(maze.open, queries, seed)]
+        cell_expanded = 0
+        junction_expanded = 0
+        cell_time = 0.0
+        junction_time = 0.0
+        for start, goal in pairs:
+            elapsed, cell_path = timed(lambda: cells.search(start, goal))
+            cell_time += elapsed
+            cell_expanded += cells.expanded
+            elapsed, junction_path = timed(lambda: junctions.search(start, goal))
+            junction_time += elapsed
+            junction_expanded += junctions.expanded
+            if (cell_path is None) != (junction_path is None) or (cell_path and len(cell_path) != len(junction_path)):
+                print(f"Paths differ between {grid.coordinates(start)} and {grid.coordinates(goal)}")
+        stats = junctions.stats()
+        print(f"{size:>5}x{size:<5} {len(grid.open_indices()):>8} {stats['junctions']:>9} {build_time:>8.2f} "
+              f"{cell_expanded / queries:>9.0f} {cell_time * 1000 / queries:>8.2f} "
+              f"{junction_expanded / queries:>9.0f} {junction_time * 1000 / queries:>8.2f} "
+              f"{cell_expanded / max(1, junction_expanded):>9.1f} {cell_time / junction_time:>8.1f}")
+
+
+def run_replan(size, games, ticks, seed):
+    # Per-ghost cost of incremental chase replanning against the full searches it replaces
+    maze = generate_maze(size, size, seed) if size else None
+    print(f"{'strategy':>12} {'game':>5} {'ghost':>6} {'repairs':>8} {'failed':>7} {'searches':>9} "
+          f"{'exp/repair':>11} {'exp/search':>11} {'ratio':>7} {'game s':>7}")
+    for strategy in ChaseStrategy:
+        for game in range(games):
+            pacman_game, world = create_game(headless=True, seed=seed + game, maze=maze, chase_strategy=strategy)
+            ghosts = list(world.get_ghosts())
+            elapsed, _ = timed(lambda: world.tick(120, ticks))
+            if strategy == ChaseStrategy.ASTAR:
+                print(f"{strategy.name:>12} {game:>5} {'all':>6} {'-':>8} {'-':>7} {pacman_game.p.misses:>9} "
+                      f"{'-':>11} {'-':>11} {'-':>7} {elapsed:>7.2f}")
+                continue
+            for number, ghost in enumerate(ghosts):
+                if ghost.chase_planner is None:
+                    continue
+                stats = ghost.chase_planner.stats()
+                per_search = stats["expanded_per_search"]
+                ratio = stats["expanded_per_repair"] / per_search if per_search else 0.0
+                print(f"{strategy.name:>12} {game:>5} {number:>6} {stats['repairs']:>8} {stats['failed_repairs']:>7} "
+                      f"{stats['full_searches']:>9} {stats['expanded_per_repair']:>11.1f} {per_search:>11.1f} "
+                      f"{ratio:>7.3f} {elapsed:>7.2f}")
+
+
+def add_ghosts(pacman_game, world, count, seed):
+    # Extra ghosts on random cells, away from Pacman's spawn
+    rng = random.Random(seed)
+    spawn = pacman_game.pacman_spawn
+    cells = [cell for cell in pacman_game.reachable_spaces if abs(cell[0] - spawn[0]) + abs(cell[1] - spawn[1]) > 8]
+    for x, y in rng.choices(cells, k=count):
+        world.add_ghost(Ghost(world, x * WORLD_CELL_SIZE, y * WORLD_CELL_SIZE, WORLD_CELL_SIZE, pacman_game))
+
+
+def run_stress(ghost_counts, size, ticks, seed):
+    # Hundreds of ghosts chasing one Pacman, who gets enough lives that every run lasts all ticks
+    maze = generate_maze(size, size, seed) if size else None
+    print(f"{'ghosts':>7} {'strategy':>12} {'ticks/s':>9} {'searches':>9} {'field builds':>13}")
+    for count in ghost_counts:
+        for strategy in ChaseStrategy:
+            pacman_game, world = create_game(headless=True, seed=seed, maze=maze, chase_strategy=strategy)
+            add_ghosts(pacman_game, world, count - len(world.get_ghosts()), seed)
+            # Every ghost touching Pacman costs a life, so give him one per ghost per tick
+            world.lives = ticks * count
+            # Stepped directly, without the mode timers, so the ghosts chase for the whole run
+            world.set_current_mode(GhostBehaviour.CHASE)
+            elapsed, _ = timed(lambda: [world.step() for _ in range(ticks)])
+            planners = [ghost.chase_planner for ghost in world.get_ghosts() if ghost.chase_planner is not None]
+            searches = pacman_game.p.misses + sum(planner.full_searches for planner in planners)
+            print(f"{count:>7} {strategy.name:>12} {world.ticks / elapsed:>9.0f} {searches:>9} "
+                  f"{pacman_game.fields.pacman.builds:>13}")
+
+
+def run_planner(size, ghosts, ticks, workers, seed):
+    # Tick times with searches inside the game loop against searches on a planner pool
+    maze = generate_maze(size, size, seed)
+    print(f"{'planner':>16} {'mean ms':>8} {'p99 ms':>8} {'worst ms':>9} {'searches':>9} {'cancelled':>10} "
+          f"{'max depth':>10} {'latency p50':>12} {'latency p95':>12}")
+    for name, planner_workers, processes in (("in loop", 0, False), (f"{workers} threads", workers, False),
+                                              (f"{workers} processes", workers, True)):
+        pacman_game, world = create_game(headless=True, seed=seed, maze=maze, planner_workers=planner_workers,
+                                         planner_processes=processes)
+        add_ghosts(pacman_game, world, ghosts, seed)
+        world.scheduler.fps = 120
+        world.handle_mode_switch()
+        times = []
+        for _ in range(ticks):
+            started = time.perf_counter()
+            world.step()
+            world.handle_scheduled_events()
+            times.append(time.perf_counter() - started)
+            if world.pacman is None or world.won:
+                break
+        pacman_game.close()
+        times.sort()
+        mean = sum(times) * 1000 / len(times)
+        p99 = times[len(times) * 99 // 100] * 1000
+        if pacman_game.planner is None:
+            print(f"{name:>16} {mean:>8.3f} {p99:>8.3f} {times[-1] * 1000:>9.2f} {pacman_game.p.misses:>9} "
+                  f"{'-':>10} {'-':>10} {'-':>12} {'-':>12}")
+            continue
+        stats = pacman_game.planner.stats()
+        print(f"{name:>16} {mean:>8.3f} {p99:>8.3f} {times[-1] * 1000:>9.2f} {stats['completed']:>9} "
+              f"{stats['cancelled'] + stats['discarded']:>10} {stats['max_queue_depth']:>10} "
+              f"{stats['latency_p50_ms']:>10.2f}ms {stats['latency_p95_ms']:>10.2f}ms")
+
+
+def run_requests(size, ghosts, ticks, budgets_ms, budget_nodes, seed):
+    # Tick times of a crowd of chasing ghosts with every search run when asked for, against the path
+    # scheduler with time and node budgets. Caught counts the lives the ghosts took, to show what the
+    # waiting costs them. Tick times cover the whole step, serve the scheduler's share of the worst tick.
+    maze = generate_maze(size, size, seed)
+    print(f"{'budget':>10} {'mean ms':>8} {'p99 ms':>8} {'worst ms':>9} {'serve ms':>9} {'searches':>9} "
+          f"{'merged':>7} {'deferred':>9} {'max wait':>9} {'caught':>7}")
+    budgets = [(None, None)] + [(budget, None) for budget in budgets_ms] + [(None, nodes) for nodes in budget_nodes]
+    for budget_ms, nodes in budgets:
+        pacman_game, world = create_game(headless=True, seed=seed, maze=maze, path_budget_ms=budget_ms,
+                                         path_budget_nodes=nodes)
+        add_ghosts(pacman_game, world, ghosts, seed)
+        lives = world.lives = ticks * (ghosts + 4)
+        world.set_current_mode(GhostBehaviour.CHASE)
+        times = []
+        for _ in range(ticks):
+            started = time.perf_counter()
+            world.step()
+            times.append(time.perf_counter() - started)
+        times.sort()
+        mean = sum(times) * 1000 / len(times)
+        p99 = times[len(times) * 99 // 100] * 1000
+        name = "none" if budget_ms is None and nodes is None else (f"{budget_ms:g} ms" if nodes is None
+                                                                    else f"{nodes} nodes")
+        scheduler = pacman_game.path_scheduler
+        if scheduler is None:
+            serve = merged = deferred = max_wait = "-"
+        else:
+            stats = scheduler.stats()
+            serve = f"{stats['worst_serve_ms']:.2f}"
+            merged, deferred, max_wait = stats["merged"], stats["deferred"], stats["max_wait_ticks"]
+        print(f"{name:>10} {mean:>8.3f} {p99:>8.3f} {times[-1] * 1000:>9.2f} {serve:>9} {pacman_game.p.misses:>9} "
+              f"{merged:>7} {deferred:>9} {max_wait:>9} {lives - world.lives:>7}")
+
+
+def run_lookahead(budgets, games, ticks, seed):
+    # Cost of the GameState operations, then how Pacman plays with growing lookahead budgets
+    pacman_game, world = create_game(headless=True, seed=seed)
+    state = GameState.from_world(world)
+    pacman_move = state.pacman_moves()[0]
+    ghost_moves = [state.ghost_moves(ghost)[0] for ghost in range(len(state.ghosts))]
+    repeat = 20000
+
+    def step_undo():
+        for _ in range(repeat):
+            state.step(pacman_move, ghost_moves)
+            state.undo()
+    clone_time, _ = timed(lambda: [state.clone() for _ in range(repeat)])
+    step_time, _ = timed(step_undo)
+    print(f"clone {clone_time * 1e6 / repeat:.2f} us, step + undo {step_time * 1e6 / repeat:.2f} us")
+
+    print(f"{'budget ms':>10} {'won':>5} {'mean score':>11} {'mean depth':>11} {'decision ms':>12}")
+    for budget in [None] + budgets:
+        won = 0
+        score = 0
+        depth = 0.0
+        decision = 0.0
+        for game in range(games):
+            policy = LookaheadPolicy(budget) if budget else None
+            _, world = create_game(headless=True, seed=seed + game, lookahead=policy)
+            world.tick(120, ticks)
+            won += world.won
+            score += world.score
+            if policy is not None:
+                stats = policy.stats()
+                depth += stats["mean_depth"] / games
+                decision += stats["mean_ms"] / games
+        name = f"{budget:g}" if budget else "greedy"
+        print(f"{name:>10} {won:>2}/{games:<2} {score / games:>11.1f} {depth:>11.2f} {decision:>12.3f}")
+
+
+def run_cells(games, ticks, seed):
+    # The same games simulated a pixel and a whole cell per step: steps taken, time and outcome
+    print(f"{'mode':>6} {'steps':>9} {'seconds':>8} {'won':>5} {'mean score':>11} {'mean lives':>11}")
+    outcomes = {}
+    for cell_steps in (False, True):
+        steps = 0
+        elapsed = 0.0
+        outcomes[cell_steps] = []
+        for game in range(games):
+            _, world = create_game(headless=True, seed=seed + game, cell_steps=cell_steps)
+            elapsed += timed(lambda: world.tick(120, ticks))[0]
+            steps += world.ticks // world.step_ticks
+            outcomes[cell_steps].append((world.won, world.score, world.lives))
+        won = sum(outcome[0] for outcome in outcomes[cell_steps])
+        print(f"{'cell' if cell_steps else 'pixel':>6} {steps:>9} {elapsed:>8.2f} {won:>2}/{games:<2} "
+              f"{sum(outcome[1] for outcome in outcomes[cell_steps]) / games:>11.1f} "
+              f"{sum(outcome[2] for outcome in outcomes[cell_steps]) / games:>11.2f}")
+    same = sum(pixel[0] == cell[0] for pixel, cell in zip(outcomes[False], outcomes[True]))
+    print(f"same result (won or lost) in {same}/{games} games")
+
+
+def run_env(steps, counts, workers, seed):
+    # Environment steps a second with random actions, one environment in process and vectors of them
+    rng = np.random.default_rng(seed)
+    env = PacmanEnv(seed=seed)
+
+    def play(actions):
+        for action in actions:
+            _, _, terminated, truncated = env.step(action)
+            if terminated or truncated:
+                env.reset()
+    elapsed, _ = timed(lambda: play(rng.integers(len(ACTIONS), size=steps).tolist()))
+    env.close()
+    print(f"{'envs':>5} {'workers':>8} {'steps/s':>10}")
+    print(f"{1:>5} {'-':>8} {steps / elapsed:>10.0f}")
+    for count in counts:
+        for worker_count in workers:
+            if worker_count > count:
+                continue
+            vector = VectorEnv(count, worker_count, seed=seed)
+            vector.reset()
+            actions = rng.integers(len(ACTIONS), size=(steps // count, count))
+            elapsed, _ = timed(lambda: [vector.step(row) for row in actions])
+            vector.close()
+            print(f"{count:>5} {worker_count:>8} {len(actions) * count / elapsed:>10.0f}")
+    print(f"{os.cpu_count()} cores")
+
+
+def run_timestep(ticks, render_rates, frame_delay):
+    # Windowed games on the dummy display: the game should keep 120 ticks a second whatever the frame
+    # rate, also when every frame is made frame_delay milliseconds slower
+    print(f"{'render fps':>10} {'delay ms':>9} {'seconds':>8} {'ticks/s':>8} {'steps':>6} {'frames':>7}")
+    for render_fps in render_rates:
+        for delay in (0, frame_delay):
+            _, world = create_game(seed=0)
+            render = world.render
+
+            def slow_render(alpha=1.0):
+                time.sleep(delay / 1000)
+                render(alpha)
+            world.render = slow_render
+            elapsed, _ = timed(lambda: world.tick(120, ticks, render_fps))
+            print(f"{render_fps:>10} {delay:>9} {elapsed:>8.2f} {world.ticks / elapsed:>8.1f} {world.sim_steps:>6} "
+                  f"{world.frames_rendered:>7}")
+
+
+# Run in a fresh interpreter, so nothing is imported or initialised yet
+STARTUP_CODE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+pacman_game, world = main.create_game(headless=True, seed=0)
+created = time.perf_counter()
+world.start(120)
+world.step()
+world.handle_scheduled_events()
+stepped = time.perf_counter()
+import agent, pygame
+print(json.dumps({"import": imported - started, "create": created - imported, "first_tick": stepped - created,
+                  "display": pygame.display.get_init(), "font": pygame.font.get_init(),
+                  "images": len(agent.sprite_manager.files)}))
+"""
+
+
+def run_startup(repeat):
+    # Import plus first headless tick in a new process, the price every batch worker pays before it plays
+    import subprocess
+    environment = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1",
+                       PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", STARTUP_CODE], env=environment, capture_output=True,
+                                text=True, check=True).stdout
+        runs.append(json.loads(output))
+    for name in ("import", "create", "first_tick"):
+        values = sorted(run[name] * 1000 for run in runs)
+        print(f"{name:>12} best {values[0]:>8.1f} ms  median {values[len(values) // 2]:>8.1f} ms")
+    total = sorted((run["import"] + run["create"] + run["first_tick"]) * 1000 for run in runs)
+    print(f"{'total':>12} best {total[0]:>8.1f} ms  median {total[len(total) // 2]:>8.1f} ms")
+    last = runs[-1]
+    print(f"display initialised: {last['display']}, font initialised: {last['font']}, images loaded: {last['images']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pathfinding, simulation and rendering benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    pathfinding = subparsers.add_parser("pathfinding", help="compare node.astar with the array-backed A* engine")
+    pathfinding.add_argument("--factors", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    pathfinding.add_argument("--queries", type=int, default=50)
+    pathfinding.add_argument("--legacy-limit", type=int, default=40000,
+                             help="largest maze (in cells) the old astar is run on")
+    pathfinding.add_argument("--seed", type=int, default=0)
+
+    routing = subparsers.add_parser("routing", help="build time, memory and query cost of precomputed routing")
+    routing.add_argument("--factors", type=int, nargs="+", default=[1, 2, 3, 4])
+    routing.add_argument("--queries", type=int, default=200)
+    routing.add_argument("--seed", type=int, default=0)
+
+    vector = subparsers.add_parser("vector", help="steps per second of the vectorized engine")
+    vector.add_argument("--batches", type=int, nargs="+", default=[1, 16, 256, 4096])
+    vector.add_argument("--steps", type=int, default=1000)
+    vector.add_argument("--seed", type=int, default=0)
+    vector.add_argument("--check", action="store_true", help="compare against the object engine first")
+    vector.add_argument("--route", type=int, default=200, help="cells Pacman walks in the consistency check")
+
+    suite = subparsers.add_parser("suite", help="reproducible micro and macro benchmarks with a JSON baseline")
+    suite.add_argument("--factors", type=int, nargs="+", default=[1, 4, 16],
+                       help="sizes of the tiled mazes the micro-benchmarks run on")
+    suite.add_argument("--repeat", type=int, default=3)
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--output", default="benchmark_results.json")
+    suite.add_argument("--baseline", default=None, help="JSON file of an earlier run to compare against")
+    suite.add_argument("--threshold", type=float, default=0.1,
+                       help="allowed slowdown against the baseline before a benchmark counts as a regression")
+
+    scaling = subparsers.add_parser("scaling", help="subsystem costs on generated mazes of growing size")
+    scaling.add_argument("--sizes", type=int, nargs="+", default=[65, 257, 1025])
+    scaling.add_argument("--queries", type=int, default=20)
+    scaling.add_argument("--ticks", type=int, default=600, help="headless game ticks run on every maze")
+    scaling.add_argument("--seed", type=int, default=0)
+
+    junction = subparsers.add_parser("junction", help="cell A* against A* over the junction graph")
+    junction.add_argument("--sizes", type=int, nargs="+", default=[201, 1001, 2001])
+    junction.add_argument("--queries", type=int, default=20)
+    junction.add_argument("--landmarks", type=int, default=8, help="0 searches with the Manhattan distance")
+    junction.add_argument("--seed", type=int, default=0)
+
+    replan = subparsers.add_parser("replan", help="cost of incremental chase replanning per ghost")
+    replan.add_argument("--size", type=int, default=101, help="side of the generated maze, 0 for the built-in one")
+    replan.add_argument("--games", type=int, default=3)
+    replan.add_argument("--ticks", type=int, default=120 * 120)
+    replan.add_argument("--seed", type=int, default=0)
+
+    stress = subparsers.add_parser("stress", help="ticks per second with hundreds of chasing ghosts")
+    stress.add_argument("--ghosts", type=int, nargs="+", default=[4, 100, 400])
+    stress.add_argument("--size", type=int, default=61, help="side of the generated maze, 0 for the built-in one")
+    stress.add_argument("--ticks", type=int, default=1200)
+    stress.add_argument("--seed", type=int, default=0)
+
+    planner = subparsers.add_parser("planner", help="tick times with searches on or off the game loop")
+    planner.add_argument("--size", type=int, default=301, help="side of the generated maze")
+    planner.add_argument("--ghosts", type=int, default=16, help="ghosts to add to the four of the maze")
+    planner.add_argument("--ticks", type=int, default=3000)
+    planner.add_argument("--workers", type=int, default=2)
+    planner.add_argument("--seed", type=int, default=0)
+
+    requests = subparsers.add_parser("requests", help="tick times of chasing ghosts with and without a path budget")
+    requests.add_argument("--size", type=int, default=201, help="side of the generated maze")
+    requests.add_argument("--ghosts", type=int, default=60, help="ghosts to add to the four of the maze")
+    requests.add_argument("--ticks", type=int, default=2400)
+    requests.add_argument("--budget-ms", type=float, nargs="+", default=[0.5, 2.0])
+    requests.add_argument("--budget-nodes", type=int, nargs="+", default=[2000])
+    requests.add_argument("--seed", type=int, default=0)
+
+    lookahead = subparsers.add_parser("lookahead", help="GameState costs and play strength per lookahead budget")
+    lookahead.add_argument("--budgets", type=float, nargs="+", default=[1, 4, 16], help="milliseconds per move")
+    lookahead.add_argument("--games", type=int, default=10)
+    lookahead.add_argument("--ticks", type=int, default=120 * 200)
+    lookahead.add_argument("--seed", type=int, default=0)
+
+    cells = subparsers.add_parser("cells", help="pixel steps against whole cell steps on the same games")
+    cells.add_argument("--games", type=int, default=20)
+    cells.add_argument("--ticks", type=int, default=120 * 200)
+    cells.add_argument("--seed", type=int, default=0)
+
+    env = subparsers.add_parser("env", help="steps a second of the reset/step environments")
+    env.add_argument("--steps", type=int, default=20000)
+    env.add_argument("--envs", type=int, nargs="+", default=[4, 16])
+    env.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    env.add_argument("--seed", type=int, default=0)
+
+    timestep = subparsers.add_parser("timestep", help="simulation rate of windowed games against their frame rate")
+    timestep.add_argument("--ticks", type=int, default=360)
+    timestep.add_argument("--render-fps", type=int, nargs="+", default=[120, 30])
+    timestep.add_argument("--frame-delay", type=float, default=25, help="milliseconds added to every frame")
+
+    startup = subparsers.add_parser("startup", help="import and first headless tick in a new process")
+    startup.add_argument("--repeat", type=int, default=10)
+
+    args = parser.parse_args()
+    if args.benchmark == "pathfinding":
+        run_pathfinding(args.factors, args.queries, args.legacy_limit, args.seed)
+    elif args.benchmark == "routing":
+        run_routing(args.factors, args.queries, args.seed)
+    elif args.benchmark == "vector":
+        if args.check:
+            check_vector_consistency(args.route, args.seed, ghosts=False)
+            check_vector_consistency(args.route, args.seed)
+        run_vector(args.batches, args.steps, args.seed)
+    elif args.benchmark == "junction":
+        run_junction(args.sizes, args.queries, args.landmarks, args.seed)
+    elif args.benchmark == "replan":
+        run_replan(args.size, args.games, args.ticks, args.seed)
+    elif args.benchmark == "stress":
+        run_stress(args.ghosts, args.size, args.ticks, args.seed)
+    elif args.benchmark == "requests":
+        run_requests(args.size, args.ghosts, args.ticks, args.budget_ms, args.budget_nodes, args.seed)
+    elif args.benchmark == "planner":
+        run_planner(args.size, args.ghosts, args.ticks, args.workers, args.seed)
+    elif args.benchmark == "timestep":
+        run_timestep(args.ticks, args.render_fps, args.frame_delay)
+    elif args.benchmark == "startup":
+        run_startup(args.repeat)
+    elif args.benchmark == "env":
+        run_env(args.steps, args.envs, args.workers, args.seed)
+    elif args.benchmark == "cells":
+        run_cells(args.games, args.ticks, args.seed)
+    elif args.benchmark == "lookahead":
+        run_lookahead(args.budgets, args.games, args.ticks, args.seed)
+    elif args.benchmark == "scaling":
+        run_scaling(args.sizes, args.queries, args.ticks, args.seed)
+    elif args.benchmark == "suite":
+        results = run_suite(args.factors, args.repeat, args.seed)
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "platform": platform.platform(),
+                       "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "seed": args.seed,
+                       "benchmarks": results}, f, indent=2)
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)["benchmarks"]
+            if compare(results, baseline, args.threshold):
+                sys.exit(1)
@@ -0,0 +1 @@
+# The game modules are flat at the top of the repository, pytest puts this directory on sys.path for the tests
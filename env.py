@@ -0,0 +1,217 @@
+import multiprocessing
+import random
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from main import create_game
+from maze import Maze
+from path import CellPath, EMPTY_PATH
+from utils import Direction
+
+FPS = 120
+# An action is an index into ACTIONS, in the order vector_sim uses
+ACTIONS = (Direction.NONE, Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT)
+# Cell of an agent that has left the game
+GONE = -1
+
+# What a step returns besides the observation, kept next to it in the vector environment's shared memory
+STEP_SPEC = (
+    ("action", (), np.int8),
+    ("reward", (), np.float32),
+    ("terminated", (), np.bool_),
+    ("truncated", (), np.bool_),
+)
+
+
+def observation_spec(maze: Maze):
+    # Name, shape and dtype of every observation array, the same for every game on a maze
+    height, width = maze.open.shape
+    return (
+        ("walls", (height, width), np.uint8),
+        # pickups.DOT and pickups.POWERUP flags
+        ("pickups", (height, width), np.uint8),
+        # Cells as (x, y), GONE once eaten or game over
+        ("pacman", (2,), np.int32),
+        ("ghosts", (len(maze.ghost_spawns), 2), np.int32),
+        # Ticks of power left
+        ("power", (), np.int32),
+        ("lives", (), np.int32),
+    )
+
+
+def layout(spec, batch=None):
+    # Byte offset of every array in a buffer that holds them all, and the size of that buffer
+    offsets = {}
+    size = 0
+    for name, shape, dtype in spec:
+        shape = shape if batch is None else (batch,) + shape
+        offsets[name] = size
+        size += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+    return offsets, size
+
+
+def buffer_arrays(buffer, spec, batch=None):
+    # Views of the arrays laid out by layout() in buffer, nothing is copied
+    offsets, _ = layout(spec, batch)
+    return {name: np.ndarray(shape if batch is None else (batch,) + shape, dtype, buffer, offsets[name])
+            for name, shape, dtype in spec}
+
+
+class PacmanEnv:
+    # A game behind reset() and step(). Every step moves Pacman one cell in the direction of the action,
+    # or leaves him standing when it is NONE or blocked, and runs one cell step of the World. The reward
+    # is the score gained. Observations are written into the same arrays every step; pass arrays from
+    # buffer_arrays() to have them written straight into shared memory.
+    def __init__(self, maze: Maze = None, seed=None, max_ticks: int = FPS * 200, observation=None):
+        self.random = random.Random(seed)
+        self.max_ticks = max_ticks
+        self.maze = maze
+        self.new_game(self.random.randrange(2 ** 32))
+        self.maze = self.game.maze
+        self.spec = observation_spec(self.maze)
+        if observation is None:
+            observation = buffer_arrays(bytearray(layout(self.spec)[1]), self.spec)
+        self.observation = observation
+        self.observation["walls"][:] = ~self.maze.open
+        self.observe()
+
+    def reset(self, seed=None):
+        self.game.close()
+        self.new_game(seed if seed is not None else self.random.randrange(2 ** 32))
+        self.observe()
+        return self.observation
+
+    def new_game(self, seed):
+        self.game, self.world = create_game(headless=True, seed=seed, maze=self.maze, cell_steps=True)
+        self.world.pacman.controlled = True
+        self.world.start(FPS)
+        # Ghost slots are fixed for the whole game, eaten ghosts stay GONE
+        self.ghosts = list(self.world.get_ghosts())
+        grid = self.world.grid
+        self.pickups = np.frombuffer(self.world.get_pickups().cells, dtype=np.uint8).reshape(
+            grid.height + 2, grid.stride)[1:-1, 1:-1]
+
+    def step(self, action: int):
+        world = self.world
+        pacman = world.pacman
+        if pacman is not None:
+            direction = ACTIONS[action]
+            x, y = pacman.get_cell()
+            if direction != Direction.NONE and world.grid.can_move(x, y, direction):
+                pacman.set_new_path(CellPath(((x + direction.value[1], y + direction.value[0]),)))
+            else:
+                pacman.set_new_path(EMPTY_PATH)
+
+        score = world.score
+        world.step()
+        world.handle_scheduled_events()
+        terminated = world.pacman is None or world.won
+        truncated = not terminated and world.ticks >= self.max_ticks
+        self.observe()
+        return self.observation, world.score - score, terminated, truncated
+
+    def observe(self):
+        world = self.world
+        observation = self.observation
+        observation["pickups"][:] = self.pickups
+        pacman = world.pacman
+        observation["pacman"][:] = pacman.get_cell() if pacman is not None else GONE
+        alive = world.get_ghosts()
+        ghosts = observation["ghosts"]
+        for slot, ghost in enumerate(self.ghosts):
+            ghosts[slot] = ghost.get_cell() if ghost in alive else GONE
+        observation["power"][...] = max(0, world.power_end_tick - world.ticks) if world.is_power_active() else 0
+        observation["lives"][...] = world.lives
+
+    def close(self):
+        self.game.close()
+
+
+def run_worker(connection, memory_name, maze, first, last, count, seed, max_ticks):
+    # Steps environments first to last of the vector in a worker process. Commands come over the pipe,
+    # actions, observations and results go through shared memory.
+    memory = shared_memory.SharedMemory(name=memory_name)
+    spec = observation_spec(maze)
+    arrays = buffer_arrays(memory.buf, spec + STEP_SPEC, count)
+    envs = [PacmanEnv(maze, None if seed is None else seed + index, max_ticks,
+                      {name: arrays[name][index, ...] for name, _, _ in spec}) for index in range(first, last)]
+    connection.send(None)
+    command = None
+    while command != "close":
+        command = connection.recv()
+        for index, env in enumerate(envs, first):
+            if command == "reset":
+                env.reset()
+            elif command == "step":
+                _, reward, terminated, truncated = env.step(int(arrays["action"][index]))
+                arrays["reward"][index] = reward
+                arrays["terminated"][index] = terminated
+                arrays["truncated"][index] = truncated
+                if terminated or truncated:
+                    # The observation returned is the first of the next game
+                    env.reset()
+        connection.send(None)
+
+    for env in envs:
+        env.close()
+    # Views into the shared memory have to be gone before it can be closed
+    del envs, arrays
+    memory.close()
+
+
+class VectorEnv:
+    # count PacmanEnvs stepped together by worker processes, each running a slice of them. Actions,
+    # observations, rewards and flags for all environments live in one shared memory block, so a step
+    # only sends a short command down each pipe. The arrays returned are views into that block and are
+    # overwritten by the next step; copy them to keep them.
+    def __init__(self, count: int, workers: int = None, maze: Maze = None, seed=None, max_ticks: int = FPS * 200):
+        if maze is None:
+            probe = PacmanEnv(max_ticks=max_ticks)
+            maze = probe.maze
+            probe.close()
+        self.count = count
+        self.spec = observation_spec(maze) + STEP_SPEC
+        self.memory = shared_memory.SharedMemory(create=True, size=layout(self.spec, count)[1])
+        self.arrays = buffer_arrays(self.memory.buf, self.spec, count)
+        self.observation = {name: self.arrays[name] for name, _, _ in observation_spec(maze)}
+
+        workers = min(count, workers or count)
+        bounds = [count * worker // workers for worker in range(workers + 1)]
+        self.connections = []
+        self.processes = []
+        for first, last in zip(bounds, bounds[1:]):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_worker, daemon=True, args=(
+                worker_connection, self.memory.name, maze, first, last, count, seed, max_ticks))
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+        self.wait()
+
+    def send(self, command):
+        for connection in self.connections:
+            connection.send(command)
+        self.wait()
+
+    def wait(self):
+        for connection in self.connections:
+            connection.recv()
+
+    def reset(self):
+        self.send("reset")
+        return self.observation
+
+    def step(self, actions):
+        self.arrays["action"][:] = actions
+        self.send("step")
+        return self.observation, self.arrays["reward"], self.arrays["terminated"], self.arrays["truncated"]
+
+    def close(self):
+        self.send("close")
+        for process in self.processes:
+            process.join()
+        self.observation = None
+        self.arrays = None
+        self.memory.close()
+        self.memory.unlink()
@@ -0,0 +1,197 @@
+from heapq import heappush, heappop
+
+from grid import MazeGrid
+from pickups import DOT, POWERUP
+
+UNREACHED = -1
+
+
+class DistanceField:
+    # Maze distance from every cell to the nearest of a set of source cells, built by a multi-source
+    # BFS. Walking downhill from any cell is a shortest path to the nearest source.
+    def __init__(self, grid: MazeGrid):
+        self.grid = grid
+        self.distances = [UNREACHED] * grid.size
+        self.key = None
+        self.builds = 0
+        # Sources removed without a full build
+        self.updates = 0
+
+    def build(self, sources, key=None):
+        open_cells = self.grid.open
+        offsets = self.grid.offsets
+        distances = [UNREACHED] * self.grid.size
+        frontier = [source for source in sources if open_cells[source]]
+        for source in frontier:
+            distances[source] = 0
+
+        level = 0
+        while frontier:
+            level += 1
+            next_frontier = []
+            for cell in frontier:
+                for offset in offsets:
+                    neighbour = cell + offset
+                    if open_cells[neighbour] and distances[neighbour] == UNREACHED:
+                        distances[neighbour] = level
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+
+        self.distances = distances
+        self.key = key
+        self.builds += 1
+
+    def remove_sources(self, removed, key=None):
+        # Updates the field for sources that are gone, touching only the cells whose nearest source was one
+        # of them. First every cell that has lost all its neighbours one step closer to a source is
+        # cleared, level by level outwards from the removed sources. Then the cleared cells are filled in
+        # again from the cells around them that kept their distance, nearest first.
+        open_cells = self.grid.open
+        offsets = self.grid.offsets
+        distances = self.distances
+        cleared = []
+        frontier = []
+        for source in removed:
+            if distances[source] == 0:
+                distances[source] = UNREACHED
+                frontier.append((source, 0))
+        while frontier:
+            next_frontier = []
+            for cell, level in frontier:
+                cleared.append(cell)
+                for offset in offsets:
+                    neighbour = cell + offset
+                    if distances[neighbour] != level + 1:
+                        continue
+                    # Cells of this level that lost their support were cleared with the level before
+                    supported = False
+                    for step in offsets:
+                        if distances[neighbour + step] == level:
+                            supported = True
+                            break
+                    if not supported:
+                        distances[neighbour] = UNREACHED
+                        next_frontier.append((neighbour, level + 1))
+            frontier = next_frontier
+
+        queue = []
+        for cell in cleared:
+            best = None
+            for offset in offsets:
+                distance = distances[cell + offset]
+                if distance != UNREACHED and (best is None or distance < best):
+                    best = distance
+            if best is not None:
+                heappush(queue, (best + 1, cell))
+        while queue:
+            distance, cell = heappop(queue)
+            current = distances[cell]
+            if current != UNREACHED and current <= distance:
+                continue
+            distances[cell] = distance
+            for offset in offsets:
+                neighbour = cell + offset
+                if open_cells[neighbour] and (distances[neighbour] == UNREACHED or
+                                              distances[neighbour] > distance + 1):
+                    heappush(queue, (distance + 1, neighbour))
+        self.key = key
+        self.updates += 1
+
+    def distance(self, index):
+        return self.distances[index]
+
+    def descend(self, index):
+        # Cells from index down to the nearest source, both ends included
+        distances = self.distances
+        remaining = distances[index]
+        if remaining == UNREACHED:
+            return None
+
+        path = [index]
+        while remaining > 0:
+            remaining -= 1
+            for offset in self.grid.offsets:
+                if distances[index + offset] == remaining:
+                    index += offset
+                    break
+            path.append(index)
+        return path
+
+    def step(self, index):
+        # The neighbour one cell closer to the nearest source, None at a source or where nothing is reachable
+        distances = self.distances
+        remaining = distances[index] - 1
+        if remaining < 0:
+            return None
+        for offset in self.grid.offsets:
+            if distances[index + offset] == remaining:
+                return index + offset
+        return None
+
+    def ascend(self, index, steps):
+        # Greedy walk away from the sources, stops early at a local maximum
+        distances = self.distances
+        path = [index]
+        for _ in range(steps):
+            best = index
+            for offset in self.grid.offsets:
+                neighbour = index + offset
+                if distances[neighbour] > distances[best]:
+                    best = neighbour
+            if best == index:
+                break
+            index = best
+            path.append(index)
+        return path
+
+
+class DistanceFields:
+    # The fields Pacman decides with. Each one is rebuilt lazily, only when its sources have changed
+    # since the last query.
+    def __init__(self, grid: MazeGrid):
+        self.grid = grid
+        self.dots = DistanceField(grid)
+        self.powerups = DistanceField(grid)
+        self.ghosts = DistanceField(grid)
+        # Distance to Pacman, shared by every ghost that chases him with ChaseStrategy.FLOW_FIELD
+        self.pacman = DistanceField(grid)
+        # Paths handed out from the fields, each one a search that Path.get_path did not have to run
+        self.paths_served = 0
+
+    def dot_field(self, pickups):
+        return self.pickup_field(self.dots, pickups, DOT)
+
+    def powerup_field(self, pickups):
+        return self.pickup_field(self.powerups, pickups, POWERUP)
+
+    def pickup_field(self, field, pickups, kind):
+        # Keyed on the version of its own kind and how many of them had been taken. When only takes
+        # happened since, the field drops those sources; anything else (pickups added or loaded) rebuilds it.
+        version = pickups.versions[kind]
+        taken = pickups.taken[kind]
+        if field.key is not None and field.key[0] == version:
+            return field
+        if field.key is not None and version - field.key[0] == len(taken) - field.key[1]:
+            field.remove_sources(taken[field.key[1]:], (version, len(taken)))
+        else:
+            field.build(pickups.indices(kind), (version, len(taken)))
+        return field
+
+    def ghost_field(self, ghost_cells):
+        # One field to the nearest ghost rather than one per ghost: Pacman's decisions only ask how far the
+        # nearest ghost is, walk down to it when powered and climb away from all of them when fleeing, and
+        # climbing the nearest ghost field is what keeps him away from every ghost at once. It is only
+        # built when Pacman decides and a ghost has changed cell since, one BFS where per ghost fields
+        # would take one for every ghost that moved.
+        key = tuple(ghost_cells)
+        if self.ghosts.key != key:
+            self.ghosts.build(key, key)
+        return self.ghosts
+
+    def pacman_field(self, pacman_cell):
+        if self.pacman.key != pacman_cell:
+            self.pacman.build((pacman_cell,), pacman_cell)
+        return self.pacman
+
+    def builds(self):
+        return self.dots.builds + self.powerups.builds + self.ghosts.builds + self.pacman.builds
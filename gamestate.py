@@ -0,0 +1,223 @@
+from time import perf_counter
+
+from fields import UNREACHED
+from grid import MazeGrid
+from pickups import DOT, POWERUP
+from utils import GhostBehaviour, ScoreType
+
+CELL_SIZE = 32
+# 15 seconds of power at 120 ticks a second, as in World
+POWER_TICKS = 15 * 120
+# Points a lost life and a cleared maze are worth to the lookahead
+DEATH_VALUE = -5000
+WIN_VALUE = 5000
+
+
+class GameState:
+    # The game reduced to what decides its outcome, at cell resolution: one step moves every agent one
+    # cell, which is CELL_SIZE ticks of the real game. Cells are flat MazeGrid indices and the pickups
+    # are a copy of the PickupGrid flags. step() keeps an undo record, so a search can walk down and
+    # back up the game tree without copying anything; clone() is there for keeping a state around.
+    __slots__ = ("grid", "pacman", "ghosts", "ghost_previous", "ghost_alive", "pickups", "dots", "power",
+                 "mode", "score", "lives", "dead", "history")
+
+    def __init__(self, grid: MazeGrid, pacman, ghosts, pickups, dots, power=0,
+                 mode: GhostBehaviour = GhostBehaviour.CHASE, score=0, lives=3):
+        self.grid = grid
+        self.pacman = pacman
+        self.ghosts = list(ghosts)
+        self.ghost_previous = list(ghosts)
+        self.ghost_alive = [True] * len(self.ghosts)
+        self.pickups = pickups
+        self.dots = dots
+        # Ticks of power left
+        self.power = power
+        self.mode = mode
+        self.score = score
+        self.lives = lives
+        self.dead = False
+        self.history = []
+
+    @classmethod
+    def from_world(cls, world, ghosts=None):
+        grid = world.grid
+        ghosts = world.get_ghosts() if ghosts is None else ghosts
+        power = max(0, world.power_end_tick - world.ticks) if world.is_power_active() else 0
+        return cls(grid, grid.index(*world.pacman.get_cell()), [grid.index(*ghost.get_cell()) for ghost in ghosts],
+                   bytearray(world.get_pickups().cells), world.get_pickups().dot_count, power,
+                   world.get_current_mode(), world.score, world.lives)
+
+    def clone(self):
+        state = GameState.__new__(GameState)
+        state.grid = self.grid
+        state.pacman = self.pacman
+        state.ghosts = self.ghosts[:]
+        state.ghost_previous = self.ghost_previous[:]
+        state.ghost_alive = self.ghost_alive[:]
+        state.pickups = bytearray(self.pickups)
+        state.dots = self.dots
+        state.power = self.power
+        state.mode = self.mode
+        state.score = self.score
+        state.lives = self.lives
+        state.dead = self.dead
+        state.history = []
+        return state
+
+    def is_over(self):
+        return self.dead or self.dots == 0
+
+    def pacman_moves(self):
+        return self.grid.neighbours(self.pacman)
+
+    def ghost_moves(self, ghost):
+        # Ghosts never turn back unless they are in a dead end
+        if not self.ghost_alive[ghost]:
+            return [self.ghosts[ghost]]
+        moves = self.grid.neighbours(self.ghosts[ghost])
+        if len(moves) > 1:
+            previous = self.ghost_previous[ghost]
+            moves = [move for move in moves if move != previous]
+        return moves
+
+    def step(self, pacman_move, ghost_moves):
+        self.history.append((self.pacman, self.ghosts[:], self.ghost_previous[:], self.ghost_alive[:], self.dots,
+                             self.power, self.score, self.lives, self.dead, self.pickups[pacman_move]))
+        previous = self.pacman
+        self.pacman = pacman_move
+        flags = self.pickups[pacman_move]
+        if flags & DOT:
+            self.pickups[pacman_move] &= ~DOT
+            self.dots -= 1
+            self.score += ScoreType.DOT.value
+        self.power = max(0, self.power - CELL_SIZE)
+        if flags & POWERUP and not self.power:
+            self.pickups[pacman_move] &= ~POWERUP
+            self.score += ScoreType.POWERUP.value
+            self.power = POWER_TICKS
+
+        for ghost, move in enumerate(ghost_moves):
+            if not self.ghost_alive[ghost]:
+                continue
+            self.ghost_previous[ghost] = self.ghosts[ghost]
+            self.ghosts[ghost] = move
+            # Meeting on a cell or passing each other in a corridor both count as a collision
+            if move == pacman_move or (move == previous and self.ghost_previous[ghost] == pacman_move):
+                if self.power:
+                    self.ghost_alive[ghost] = False
+                    self.score += ScoreType.GHOST.value
+                else:
+                    self.lives -= 1
+                    self.dead = True
+
+    def undo(self):
+        (pacman, self.ghosts, self.ghost_previous, self.ghost_alive, self.dots, self.power, self.score,
+         self.lives, self.dead, flags) = self.history.pop()
+        self.pickups[self.pacman] = flags
+        self.pacman = pacman
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class LookaheadPolicy:
+    # Expectimax over GameState: Pacman picks the best move, every ghost moves uniformly at random
+    # among the moves it is allowed. Iterative deepening searches one cell deeper per round until the
+    # time budget runs out and plays the best move of the deepest finished round, so a larger budget
+    # directly buys a deeper search.
+    def __init__(self, budget_ms: float = 4.0, max_depth: int = 12):
+        self.budget = budget_ms / 1000
+        self.max_depth = max_depth
+        self.deadline = 0.0
+        self.dot_field = None
+        self.decisions = 0
+        self.depth_total = 0
+        self.nodes = 0
+        self.time_total = 0.0
+
+    def choose(self, state: GameState, dot_field):
+        # The neighbour cell of Pacman to move to next, or None when he cannot move
+        moves = state.pacman_moves()
+        if not moves:
+            return None
+        started = perf_counter()
+        self.deadline = started + self.budget
+        self.dot_field = dot_field
+        best = moves[0]
+        depth = 0
+        try:
+            for depth in range(1, self.max_depth + 1):
+                best = self.best_move(state, moves, depth)
+        except SearchTimeout:
+            depth -= 1
+            # The interrupted round may have stopped anywhere down the tree
+            while state.history:
+                state.undo()
+        self.decisions += 1
+        self.depth_total += depth
+        self.time_total += perf_counter() - started
+        return best
+
+    def best_move(self, state, moves, depth):
+        # Moves that score the same within the horizon are told apart by how close they lead to a dot,
+        # otherwise Pacman dithers between two cells whenever the nearest dots are beyond the horizon
+        best = None
+        best_value = None
+        for move in moves:
+            distance = self.dot_field.distance(move)
+            value = (self.chance(state, move, depth), -distance if distance != UNREACHED else -state.grid.size)
+            if best_value is None or value > best_value:
+                best = move
+                best_value = value
+        return best
+
+    def chance(self, state, pacman_move, depth):
+        # Every combination of ghost moves, each equally likely
+        combinations = [[]]
+        for ghost in range(len(state.ghosts)):
+            combinations = [moves + [move] for moves in combinations for move in state.ghost_moves(ghost)]
+        total = 0.0
+        for ghost_moves in combinations:
+            state.step(pacman_move, ghost_moves)
+            total += self.value(state, depth - 1)
+            state.undo()
+        return total / len(combinations)
+
+    def value(self, state, depth):
+        self.nodes += 1
+        if self.nodes & 31 == 0 and perf_counter() > self.deadline:
+            raise SearchTimeout
+        if state.dead:
+            return state.score + DEATH_VALUE
+        if state.dots == 0:
+            return state.score + WIN_VALUE
+        if depth == 0:
+            return self.evaluate(state)
+        return max(self.chance(state, move, depth) for move in state.pacman_moves())
+
+    def evaluate(self, state):
+        value = state.score
+        distance = self.dot_field.distance(state.pacman)
+        if distance != UNREACHED:
+            value -= 2 * distance
+        stride = state.grid.stride
+        pacman_y, pacman_x = divmod(state.pacman, stride)
+        for ghost, alive in zip(state.ghosts, state.ghost_alive):
+            if not alive:
+                continue
+            ghost_y, ghost_x = divmod(ghost, stride)
+            distance = abs(ghost_x - pacman_x) + abs(ghost_y - pacman_y)
+            if state.power:
+                value -= distance
+            elif distance < 3:
+                value -= (3 - distance) * 100
+        return value
+
+    def stats(self):
+        return {
+            "decisions": self.decisions,
+            "mean_depth": self.depth_total / self.decisions if self.decisions else 0.0,
+            "nodes": self.nodes,
+            "mean_ms": self.time_total * 1000 / self.decisions if self.decisions else 0.0,
+        }
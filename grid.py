@@ -0,0 +1,54 @@
+import numpy as np
+
+from utils import Direction, DIRECTION_BITS
+
+
+class MazeGrid:
+    # Flat, wall-padded view of the maze. Every cell is addressed by a single integer index and the
+    # border of walls around it means neighbours never need a bounds check.
+    def __init__(self, in_arr):
+        maze = np.asarray(in_arr, dtype=np.bool_)
+        if maze.ndim != 2:
+            raise ValueError("Maze must be a 2D grid")
+
+        self.height, self.width = maze.shape
+        self.stride = self.width + 2
+        padded = np.zeros((self.height + 2, self.stride), dtype=np.uint8)
+        padded[1:-1, 1:-1] = maze
+        self.open = bytearray(padded.tobytes())
+        self.size = len(self.open)
+
+        # Index offsets in the same order as node.astar explores: up, down, left, right
+        self.offsets = (-self.stride, self.stride, -1, 1)
+
+        # Bitmask of the directions that lead from each open cell into another open cell
+        legal = np.zeros_like(padded)
+        open_cells = padded.astype(np.bool_)
+        for direction, shift, axis in ((Direction.UP, 1, 0), (Direction.DOWN, -1, 0),
+                                       (Direction.LEFT, 1, 1), (Direction.RIGHT, -1, 1)):
+            neighbour_open = np.roll(open_cells, shift, axis=axis)
+            legal[open_cells & neighbour_open] |= DIRECTION_BITS[direction]
+        self.legal_moves = bytearray(legal.tobytes())
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def index(self, x, y):
+        return (y + 1) * self.stride + x + 1
+
+    def coordinates(self, index):
+        y, x = divmod(index, self.stride)
+        return x - 1, y - 1
+
+    def is_open(self, x, y):
+        return self.in_bounds(x, y) and self.open[self.index(x, y)] == 1
+
+    def can_move(self, x, y, direction: Direction):
+        return self.in_bounds(x, y) and bool(self.legal_moves[self.index(x, y)] & DIRECTION_BITS[direction])
+
+    def neighbours(self, index):
+        open_cells = self.open
+        return [index + offset for offset in self.offsets if open_cells[index + offset]]
+
+    def open_indices(self):
+        return np.flatnonzero(np.frombuffer(self.open, dtype=np.uint8)).tolist()
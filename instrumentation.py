@@ -0,0 +1,148 @@
+import csv
+import json
+from collections import deque
+from time import perf_counter
+
+# Phases are exclusive: time spent in a phase entered inside another one, like pathfinding and collision
+# inside agents, counts for the inner phase only, so the phases of a tick add up to its measured time
+PHASES = ("agents", "pathfinding", "collision", "events")
+# Phases of a drawn frame, which can cover several ticks or none, so they are recorded per frame
+FRAME_PHASES = ("render", "input")
+COUNTERS = ("astar_calls", "nodes_expanded", "path_length", "cache_hits", "collision_checks")
+PERCENTILES = (50, 95, 99)
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class PhaseTimer:
+    __slots__ = ("instrumentation", "phase")
+
+    def __init__(self, instrumentation, phase):
+        self.instrumentation = instrumentation
+        self.phase = phase
+
+    def __enter__(self):
+        self.instrumentation.enter_phase(self.phase)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.exit_phase()
+        return False
+
+
+class Instrumentation:
+    # Per-tick phase timings and counters over a rolling window of ticks, and per-frame timings over a
+    # window of frames. While disabled, phase() hands out a shared no-op context manager and count()
+    # returns straight away.
+    def __init__(self, enabled: bool = False, window: int = 600):
+        self.enabled = enabled
+        self.overlay = False
+        self.history = deque(maxlen=window)
+        self.frame_history = deque(maxlen=window)
+        self.current = None
+        self.frame = None
+        self.timers = {phase: PhaseTimer(self, phase) for phase in PHASES + FRAME_PHASES}
+        # [phase, started] of the phases entered and not yet left, the innermost last. Only the innermost
+        # one is timed; the ones around it are paused until it is left. A phase can be entered again
+        # inside itself.
+        self.stack = []
+        self.reset_tick()
+        self.reset_frame()
+
+    def reset_tick(self):
+        self.current = dict.fromkeys(PHASES + COUNTERS, 0)
+
+    def reset_frame(self):
+        self.frame = dict.fromkeys(FRAME_PHASES, 0)
+
+    def add_time(self, phase, elapsed):
+        record = self.frame if phase in self.frame else self.current
+        record[phase] += elapsed
+
+    def enter_phase(self, phase):
+        now = perf_counter()
+        stack = self.stack
+        if stack:
+            outer = stack[-1]
+            self.add_time(outer[0], now - outer[1])
+        stack.append([phase, now])
+
+    def exit_phase(self):
+        now = perf_counter()
+        stack = self.stack
+        phase, started = stack.pop()
+        self.add_time(phase, now - started)
+        if stack:
+            stack[-1][1] = now
+
+    def enable(self, overlay: bool = False):
+        self.enabled = True
+        self.overlay = overlay
+
+    def phase(self, name):
+        return self.timers[name] if self.enabled else NULL_TIMER
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.current[name] += amount
+
+    def end_tick(self):
+        if self.enabled:
+            self.history.append(self.current)
+            self.reset_tick()
+
+    def end_frame(self):
+        if self.enabled:
+            self.frame_history.append(self.frame)
+            self.reset_frame()
+
+    def summary(self):
+        # Phase timings in milliseconds, counters per tick; frame phases per frame
+        summary = {}
+        for names, history in ((PHASES + COUNTERS, self.history), (FRAME_PHASES, self.frame_history)):
+            count = len(history)
+            for name in names:
+                scale = 1 if name in COUNTERS else 1000
+                values = sorted(record[name] * scale for record in history)
+                stats = {"mean": sum(values) / count if count else 0.0}
+                for percentile in PERCENTILES:
+                    stats[f"p{percentile}"] = values[min(count - 1, count * percentile // 100)] if count else 0.0
+                summary[name] = stats
+        return summary
+
+    def export(self, path):
+        summary = self.summary()
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["metric", "per", "mean"] + [f"p{percentile}" for percentile in PERCENTILES])
+                for name, stats in summary.items():
+                    per = "frame" if name in FRAME_PHASES else "tick"
+                    writer.writerow([name, per, stats["mean"]] +
+                                    [stats[f"p{percentile}"] for percentile in PERCENTILES])
+        else:
+            metrics = {name: stats for name, stats in summary.items() if name not in FRAME_PHASES}
+            frame_metrics = {name: summary[name] for name in FRAME_PHASES}
+            with open(path, "w") as f:
+                json.dump({"ticks": len(self.history), "metrics": metrics,
+                           "frames": len(self.frame_history), "frame_metrics": frame_metrics}, f, indent=2)
+
+    def overlay_lines(self):
+        summary = self.summary()
+        lines = [f"{phase}: {summary[phase]['mean']:.3f} ms (p95 {summary[phase]['p95']:.3f})" for phase in PHASES]
+        lines += [f"{phase}: {summary[phase]['mean']:.3f} ms/frame (p95 {summary[phase]['p95']:.3f})"
+                  for phase in FRAME_PHASES]
+        lines += [f"{counter}: {summary[counter]['mean']:.1f}/tick" for counter in COUNTERS]
+        return lines
+
+
+instruments = Instrumentation()
@@ -0,0 +1,263 @@
+import math
+import time
+from heapq import heappush, heappop
+
+import numpy as np
+
+from grid import MazeGrid
+
+# Stand-ins for the start and goal cell while they are attached to the graph
+START = -1
+GOAL = -2
+
+
+class JunctionGraph:
+    # The maze collapsed into its junctions and the corridors between them. Junctions are the open
+    # cells that do not have exactly two open neighbours (crossings, T pieces and dead ends), and a
+    # corridor is the run of two-neighbour cells joining two of them, stored whole with both junctions
+    # at its ends. A search attaches the start and goal cells to the ends of their corridors, runs A*
+    # over the junctions only and walks the corridors it used to get the cells back.
+    #
+    # Manhattan distance badly underestimates maze distance, so A* is guided by landmarks instead: the
+    # maze distance from a few far apart junctions to every junction is stored, and by the triangle
+    # inequality |d(landmark, a) - d(landmark, goal)| never overestimates the distance from a to goal.
+    def __init__(self, grid: MazeGrid, landmarks: int = 8):
+        self.grid = grid
+        started = time.perf_counter()
+
+        legal = np.frombuffer(grid.legal_moves, dtype=np.uint8)
+        degree = (legal & 1) + (legal >> 1 & 1) + (legal >> 2 & 1) + (legal >> 3 & 1)
+        open_cells = np.frombuffer(grid.open, dtype=np.uint8).astype(np.bool_)
+        # Corridor of every corridor cell and its position in the corridor, -1 for junctions and walls
+        self.corridor_of = [-1] * grid.size
+        self.position_of = [-1] * grid.size
+        # Corridors as their cells from one junction to the other, both included
+        self.corridors = []
+        # Junction cell to (neighbouring junction, corridor length, corridor, position of the junction,
+        # position of the neighbour) for every corridor at it, positions counting along the corridor
+        self.adjacency = {}
+        self.junctions = set(np.flatnonzero(open_cells & (degree != 2)).tolist())
+        for junction in self.junctions:
+            self.adjacency[junction] = []
+        for junction in list(self.junctions):
+            self.trace_corridors(junction)
+
+        # Rings of corridor cells without any junction get one, so every open cell is reachable
+        for cell in np.flatnonzero(open_cells & (degree == 2)).tolist():
+            if self.corridor_of[cell] == -1 and cell not in self.junctions:
+                self.junctions.add(cell)
+                self.adjacency[cell] = []
+                self.trace_corridors(cell)
+
+        # Junction cell to its distance from every landmark
+        self.landmarks = []
+        self.landmark_distances = {}
+        if landmarks:
+            self.choose_landmarks(landmarks)
+        self.expanded = 0
+        self.build_time = time.perf_counter() - started
+
+    def choose_landmarks(self, count):
+        # Each landmark is the junction farthest from the ones chosen before it, which spreads them over
+        # the maze edges. Junctions another landmark cannot reach count as infinitely far, so separate
+        # parts of the maze get landmarks too; their distance is stored as 0, which keeps the heuristic
+        # admissible for the goals that can be reached.
+        junctions = list(self.junctions)
+        if not junctions:
+            return
+        nearest = dict.fromkeys(junctions, math.inf)
+        fields = []
+        landmark = min(junctions)
+        for _ in range(min(count, len(junctions))):
+            self.landmarks.append(landmark)
+            field = self.distances_from(landmark)
+            fields.append(field)
+            for junction in junctions:
+                distance = field.get(junction, math.inf)
+                if distance < nearest[junction]:
+                    nearest[junction] = distance
+            landmark = max(nearest, key=nearest.get)
+        self.landmark_distances = {junction: tuple(field.get(junction, 0) for field in fields)
+                                   for junction in junctions}
+
+    def distances_from(self, source):
+        # Dijkstra over the junctions, corridors weighted by their length
+        distances = {source: 0}
+        queue = [(0, source)]
+        adjacency = self.adjacency
+        while queue:
+            distance, junction = heappop(queue)
+            if distance > distances[junction]:
+                continue
+            for neighbour, length, _, _, _ in adjacency[junction]:
+                new_distance = distance + length
+                if new_distance < distances.get(neighbour, math.inf):
+                    distances[neighbour] = new_distance
+                    heappush(queue, (new_distance, neighbour))
+        return distances
+
+    def trace_corridors(self, junction):
+        open_cells = self.grid.open
+        offsets = self.grid.offsets
+        junctions = self.junctions
+        corridor_of = self.corridor_of
+        for offset in offsets:
+            cell = junction + offset
+            if not open_cells[cell] or corridor_of[cell] != -1:
+                continue
+            if cell in junctions:
+                # Neighbouring junctions are joined by an empty corridor, recorded from one side only
+                if cell > junction:
+                    self.add_corridor([junction, cell])
+                continue
+
+            cells = [junction]
+            previous = junction
+            while cell not in junctions:
+                cells.append(cell)
+                corridor_of[cell] = len(self.corridors)
+                for step in offsets:
+                    following = cell + step
+                    if following != previous and open_cells[following]:
+                        break
+                previous, cell = cell, following
+            cells.append(cell)
+            self.add_corridor(cells)
+
+    def add_corridor(self, cells):
+        corridor = len(self.corridors)
+        self.corridors.append(cells)
+        position_of = self.position_of
+        for position in range(1, len(cells) - 1):
+            position_of[cells[position]] = position
+        first = cells[0]
+        last = cells[-1]
+        end = len(cells) - 1
+        if first != last:
+            # A corridor that leads back to its own junction is never part of a shortest path
+            self.adjacency[first].append((last, end, corridor, 0, end))
+            self.adjacency[last].append((first, end, corridor, end, 0))
+
+    def attachments(self, cell):
+        # (junction, distance, corridor, position of the cell, position of the junction) for the junctions
+        # a cell is reached from or leaves through, positions counting along the corridor
+        corridor = self.corridor_of[cell]
+        if corridor == -1:
+            return [(cell, 0, -1, 0, 0)]
+        cells = self.corridors[corridor]
+        position = self.position_of[cell]
+        end = len(cells) - 1
+        return [(cells[0], position, corridor, position, 0), (cells[end], end - position, corridor, position, end)]
+
+    def search(self, start, goal):
+        # Cells from start to goal, both included, or None when goal cannot be reached. Same contract as
+        # GridAStar.search; self.expanded counts junctions instead of cells.
+        grid = self.grid
+        self.expanded = 0
+        if start == goal:
+            return [start]
+        if not grid.open[start] or not grid.open[goal]:
+            return None
+
+        # The shortest way from each junction next to the goal into it
+        exits = {}
+        for junction, distance, corridor, position, end in self.attachments(goal):
+            if junction not in exits or distance < exits[junction][0]:
+                exits[junction] = (distance, corridor, end, position)
+        heuristic = self.heuristic(goal, exits)
+
+        # parent[junction] is (previous junction, corridor, from position, to position) of the way in
+        g_score = {}
+        parent = {}
+        open_list = []
+        for junction, distance, corridor, position, end in self.attachments(start):
+            if junction not in g_score or distance < g_score[junction]:
+                g_score[junction] = distance
+                parent[junction] = (START, corridor, position, end)
+                h = heuristic(junction)
+                heappush(open_list, (distance + h, h, junction))
+        corridor = self.corridor_of[start]
+        if corridor != -1 and corridor == self.corridor_of[goal]:
+            # Start and goal share a corridor, straight along it may be the shortest way
+            distance = abs(self.position_of[start] - self.position_of[goal])
+            g_score[GOAL] = distance
+            parent[GOAL] = (START, corridor, self.position_of[start], self.position_of[goal])
+            heappush(open_list, (distance, 0, GOAL))
+
+        closed = set()
+        adjacency = self.adjacency
+        expanded = 0
+        while open_list:
+            current = heappop(open_list)[2]
+            if current in closed:
+                continue
+            closed.add(current)
+            if current == GOAL:
+                self.expanded = expanded
+                return self.expand(start, parent)
+            expanded += 1
+
+            g = g_score[current]
+            way_out = exits.get(current)
+            if way_out is not None and (GOAL not in g_score or g + way_out[0] < g_score[GOAL]):
+                g_score[GOAL] = g + way_out[0]
+                parent[GOAL] = (current,) + way_out[1:]
+                heappush(open_list, (g + way_out[0], 0, GOAL))
+            for neighbour, length, corridor, first, last in adjacency[current]:
+                new_g = g + length
+                if neighbour in closed or (neighbour in g_score and g_score[neighbour] <= new_g):
+                    continue
+                g_score[neighbour] = new_g
+                parent[neighbour] = (current, corridor, first, last)
+                h = heuristic(neighbour)
+                heappush(open_list, (new_g + h, h, neighbour))
+        self.expanded = expanded
+        return None
+
+    def heuristic(self, goal, exits):
+        # Lower bound on the distance from a junction to goal
+        if not self.landmarks:
+            stride = self.grid.stride
+            goal_y, goal_x = divmod(goal, stride)
+
+            def manhattan(junction):
+                y, x = divmod(junction, stride)
+                return abs(x - goal_x) + abs(y - goal_y)
+            return manhattan
+
+        landmark_distances = self.landmark_distances
+        # Every way to the goal passes one of the junctions next to it, so its landmark distances are exact
+        goal_distances = [min(landmark_distances[junction][i] + way_in[0] for junction, way_in in exits.items())
+                          for i in range(len(self.landmarks))]
+
+        def landmark_bound(junction):
+            return max(abs(a - b) for a, b in zip(landmark_distances[junction], goal_distances))
+        return landmark_bound
+
+    def expand(self, start, parent):
+        # Junctions from the goal back to the start, then every corridor between them walked cell by cell
+        hops = []
+        current = GOAL
+        while current != START:
+            previous, corridor, first, last = parent[current]
+            hops.append((corridor, first, last))
+            current = previous
+        path = [start]
+        for corridor, first, last in reversed(hops):
+            # Without a corridor the start or the goal is a junction itself
+            if corridor == -1:
+                continue
+            cells = self.corridors[corridor]
+            if first <= last:
+                path.extend(cells[first + 1:last + 1])
+            else:
+                path.extend(cells[last:first][::-1])
+        return path
+
+    def stats(self):
+        return {
+            "junctions": len(self.junctions),
+            "corridors": len(self.corridors),
+            "landmarks": len(self.landmarks),
+            "build_time": self.build_time,
+        }
@@ -1,12 +1,30 @@
+import argparse
 import random
-from utils import translate_to_screen, translate_to_maze, Direction
+
+from utils import translate_to_screen, translate_to_maze, Direction, PathMode, ChaseStrategy
 from agent import Ghost, Pacman
+from fields import DistanceFields
+from gamestate import LookaheadPolicy
+from instrumentation import instruments
+from maze import Maze, compile_maze, generate_maze, load_maze
 from path import Path
-from world import World, Dot, Wall, Powerup, GhostBehaviour
+from planner import PathPlanner, PathScheduler, follow_from
+from replay import ReplayRecorder, ReplayPlayer
+from world import World, GhostBehaviour
 
 
 class GameEngine:
-    def __init__(self):
+    def __init__(self, path_mode: PathMode = PathMode.SEARCH, seed=None, maze: Maze = None,
+                 chase_strategy: ChaseStrategy = ChaseStrategy.ASTAR, planner_workers: int = 0,
+                 planner_processes: bool = False, lookahead: LookaheadPolicy = None,
+                 path_budget_ms: float = None, path_budget_nodes: int = None):
+        # All random choices of a game come from here, so a seed makes headless games reproducible. Games
+        # without one still draw a seed, so a recording can tell which game it was.
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.random = random.Random(self.seed)
+        self.chase_strategy = chase_strategy
+        # Pacman searches ahead with this policy when it is set, instead of following his greedy rules
+        self.lookahead = lookahead
         self.ascii_maze = [
             "XXXXXXXXXXXXXXXXXXXXXXXXXXXX",
             "XP     O     XX     O      X",
@@ -27,75 +45,163 @@ class GameEngine:
             "XXXXXXXXXXXXXXXXXXXXXXXXXXXX",
         ]
 
-        self.numpy_maze = []
-        self.dot_spaces = []
-        self.powerup_spaces = []
-        self.reachable_spaces = []
-        self.ghost_spawns = []
-        self.size = (0, 0)
-        self.convert_maze_to_numpy()
-        self.p = Path(self.numpy_maze)
+        # Compiled once with NumPy: a boolean grid plus coordinate arrays of the special cells
+        self.maze = maze if maze is not None else compile_maze(self.ascii_maze)
+        self.numpy_maze = self.maze.open
+        self.size = self.maze.size
+        self.dot_spaces = [tuple(cell) for cell in self.maze.dots.tolist()]
+        self.powerup_spaces = [tuple(cell) for cell in self.maze.powerups.tolist()]
+        self.ghost_spawns = [tuple(cell) for cell in self.maze.ghost_spawns.tolist()]
+        self.reachable_spaces = self.dot_spaces
+        self.pacman_spawn = self.maze.pacman_spawn
+        self.p = Path(self.numpy_maze, path_mode)
+        self.fields = DistanceFields(self.p.grid)
+        # With workers, searches run off the game loop and agents pick up their paths when they are ready
+        self.planner = None
+        if planner_workers:
+            self.planner = PathPlanner(self.numpy_maze, path_mode, planner_workers, planner_processes)
+        # With a budget, searches in the game loop are batched at the end of each tick and the least urgent
+        # wait once it is spent
+        self.path_scheduler = None
+        if self.planner is None and (path_budget_ms is not None or path_budget_nodes is not None):
+            self.path_scheduler = PathScheduler(self.p, path_budget_ms, path_budget_nodes)
 
     def request_new_random_path(self, ghost: Ghost):
-        random_space = random.choice(self.reachable_spaces)
-        current_maze_coord = translate_to_maze(ghost.get_position())
-
-        path = self.p.get_path(current_maze_coord[0], current_maze_coord[1], random_space[0],
-                               random_space[1])
-
-        if path is None:
-            print("No path found")
+        random_space = self.random.choice(self.reachable_spaces)
+        self.request_path(ghost, translate_to_maze(ghost.get_position()), random_space)
+
+    def request_path(self, agent, start, goal):
+        # Every search an agent asks for goes through here. Without a planner it runs straight away; with
+        # one, the agent keeps following its old path until collect_path hands it the new one. With a path
+        # scheduler it is handed over at the end of the tick, or a later one if the budget has run out.
+        if self.planner is not None:
+            self.planner.submit(agent, start, goal)
+        elif self.path_scheduler is not None:
+            self.path_scheduler.submit(agent, start, goal)
         else:
-            test_path = [translate_to_screen(item) for item in path]
-            ghost.set_new_path(test_path)
-
-    def convert_maze_to_numpy(self):
-        for x, row in enumerate(self.ascii_maze):
-            self.size = (len(row), x + 1)
-            binary_row = []
-            for y, column in enumerate(row):
-                if column == "G":
-                    self.ghost_spawns.append((y, x))
-
-                if column == "X":
-                    binary_row.append(0)
-                else:
-                    binary_row.append(1)
-                    self.dot_spaces.append((y, x))
-                    self.reachable_spaces.append((y, x))
-                    if column == "O":
-                        self.powerup_spaces.append((y, x))
-
-            self.numpy_maze.append(binary_row)
-
-
-if __name__ == "__main__":
+            agent.set_new_path(self.p.get_path(start[0], start[1], goal[0], goal[1]))
+
+    def collect_path(self, agent):
+        if self.planner is None:
+            return
+        result = self.planner.collect(agent)
+        if result is None:
+            return
+        path = follow_from(result[1], translate_to_maze(agent.get_position()))
+        if path is not None:
+            agent.set_new_path(path)
+
+    def is_planning(self, agent):
+        if self.path_scheduler is not None:
+            return self.path_scheduler.is_pending(agent)
+        return self.planner is not None and self.planner.is_planning(agent)
+
+    def is_deferred(self, agent):
+        # Waiting for the path scheduler, which unlike the planner leaves the agent free to keep moving
+        return self.path_scheduler is not None and self.path_scheduler.is_deferred(agent)
+
+    def stats(self):
+        # What the path mode built up front, None for the structures it does without
+        return {
+            "routing": self.p.routing.stats() if self.p.routing is not None else None,
+            "junctions": self.p.junctions.stats() if self.p.junctions is not None else None,
+        }
+
+    def close(self):
+        if self.planner is not None:
+            self.planner.shutdown()
+
+
+def create_game(headless=False, seed=None, path_mode: PathMode = PathMode.SEARCH, maze: Maze = None,
+                chase_strategy: ChaseStrategy = ChaseStrategy.ASTAR, planner_workers: int = 0,
+                planner_processes: bool = False, lookahead: LookaheadPolicy = None, cell_steps: bool = False,
+                path_budget_ms: float = None, path_budget_nodes: int = None):
     unified_size = 32
-    pacman_game = GameEngine()
-    size = pacman_game.size
-    world = World(size[0] * unified_size, size[1] * unified_size)
-
-    for y, row in enumerate(pacman_game.numpy_maze):
-        for x, column in enumerate(row):
-            if column == 0:
-                world.add_wall(Wall(world, x, y, unified_size))
+    pacman_game = GameEngine(path_mode, seed, maze, chase_strategy, planner_workers, planner_processes, lookahead,
+                             path_budget_ms, path_budget_nodes)
+    world = World(pacman_game.p.grid, headless, cell_steps)
+    world.path_scheduler = pacman_game.path_scheduler
+    world.planner = pacman_game.planner
 
     for cookie_space in pacman_game.dot_spaces:
-        translated = translate_to_screen(cookie_space)
-        cookie = Dot(world, translated[0] + unified_size / 2, translated[1] + unified_size / 2)
-        world.add_cookie(cookie)
+        world.add_cookie(cookie_space)
 
     for powerup_space in pacman_game.powerup_spaces:
-        translated = translate_to_screen(powerup_space)
-        powerup = Powerup(world, translated[0] + unified_size / 2, translated[1] + unified_size / 2)
-        world.add_powerup(powerup)
+        world.add_powerup(powerup_space)
 
     for i, ghost_spawn in enumerate(pacman_game.ghost_spawns):
         translated = translate_to_screen(ghost_spawn)
         ghost = Ghost(world, translated[0], translated[1], unified_size, pacman_game)
         world.add_ghost(ghost)
 
-    pacman = Pacman(world, unified_size, unified_size, unified_size, pacman_game)
+    spawn = translate_to_screen(pacman_game.pacman_spawn)
+    pacman = Pacman(world, spawn[0], spawn[1], unified_size, pacman_game)
     world.add_pacman(pacman)
     world.set_current_mode(GhostBehaviour.CHASE)
-    world.tick(120)
+    return pacman_game, world
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pacman")
+    parser.add_argument("--profile", action="store_true", help="time every tick and show the numbers on screen")
+    parser.add_argument("--profile-output", default=None,
+                        help="write rolling percentiles to this .json or .csv file when the game closes")
+    parser.add_argument("--maze", default=None, help="text or binary maze file to play on")
+    parser.add_argument("--generate", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"), default=None,
+                        help="play on a generated maze of this many cells")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--path-mode", choices=[mode.name.lower() for mode in PathMode], default="search",
+                        help="how paths are found: A* over cells, a routing table or A* over junctions")
+    parser.add_argument("--planner-workers", type=int, default=0,
+                        help="plan paths on this many worker threads instead of inside the game loop")
+    parser.add_argument("--planner-processes", action="store_true", help="use worker processes instead of threads")
+    parser.add_argument("--chase", choices=[strategy.name.lower() for strategy in ChaseStrategy], default="astar",
+                        help="how chasing ghosts plan their way to Pacman")
+    parser.add_argument("--lookahead", type=float, default=None, metavar="MILLISECONDS",
+                        help="let Pacman search ahead for this long before every move")
+    parser.add_argument("--cell-steps", action="store_true",
+                        help="simulate a whole cell per step and draw the agents in between")
+    parser.add_argument("--path-budget-ms", type=float, default=None, metavar="MILLISECONDS",
+                        help="search time per tick for ghost paths, the least urgent wait for a later tick")
+    parser.add_argument("--path-budget-nodes", type=int, default=None, metavar="NODES",
+                        help="search nodes per tick for ghost paths, the least urgent wait for a later tick")
+    parser.add_argument("--render-fps", type=int, default=None,
+                        help="draw at most this many frames a second, the game itself always runs at 120 ticks")
+    parser.add_argument("--record", default=None, help="write a replay of the game to this .npz file")
+    parser.add_argument("--replay", default=None, help="play back a recorded .npz file instead of a game")
+    parser.add_argument("--start", type=int, default=0, help="tick to start the replay from")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, above 1 skips frames")
+    args = parser.parse_args()
+
+    if args.replay:
+        ReplayPlayer(args.replay).render(args.start, args.speed)
+        raise SystemExit
+
+    if args.profile or args.profile_output:
+        instruments.enable(overlay=args.profile)
+    maze = None
+    if args.maze:
+        maze = load_maze(args.maze)
+    elif args.generate:
+        maze = generate_maze(args.generate[0], args.generate[1], args.seed)
+    pacman_game, world = create_game(seed=args.seed, path_mode=PathMode[args.path_mode.upper()], maze=maze,
+                                     chase_strategy=ChaseStrategy[args.chase.upper()],
+                                     planner_workers=args.planner_workers, planner_processes=args.planner_processes,
+                                     lookahead=LookaheadPolicy(args.lookahead) if args.lookahead else None,
+                                     cell_steps=args.cell_steps, path_budget_ms=args.path_budget_ms,
+                                     path_budget_nodes=args.path_budget_nodes)
+    stats = pacman_game.stats()
+    routing, junctions = stats["routing"], stats["junctions"]
+    if routing is not None:
+        print(f"Routing table: {routing['cells']} cells, built in {routing['build_time']:.3f}s, "
+              f"{routing['bytes'] / 1024:.1f} KiB")
+    if junctions is not None:
+        print(f"Junction graph: {junctions['junctions']} junctions, {junctions['corridors']} corridors, "
+              f"built in {junctions['build_time']:.3f}s")
+    recorder = ReplayRecorder(pacman_game, world) if args.record else None
+    world.tick(120, render_fps=args.render_fps)
+    pacman_game.close()
+    if recorder is not None:
+        recorder.save(args.record)
+    if args.profile_output:
+        instruments.export(args.profile_output)
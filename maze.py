@@ -0,0 +1,198 @@
+import itertools
+import struct
+
+import numpy as np
+
+WALL = "X"
+POWERUP = "O"
+GHOST = "G"
+PACMAN = "P"
+
+# Binary layout: header, the open cells packed 8 per byte, then (x, y) pairs of the powerups and
+# ghost spawns as little-endian int32
+MAGIC = b"PMAZ"
+HEADER = struct.Struct("<4sIIIIii")
+
+# Every order in which the generator can try the four directions of a cell
+DIRECTION_ORDERS = np.array(list(itertools.permutations(range(4))), dtype=np.int8)
+
+
+class Maze:
+    # A compiled maze: a boolean grid of open cells indexed [row, column] and (x, y) coordinate
+    # arrays of the special cells. Like the hand-drawn maze, every open cell starts with a dot.
+    def __init__(self, open_cells, powerups=(), ghost_spawns=(), pacman_spawn=None):
+        self.open = np.ascontiguousarray(open_cells, dtype=np.bool_)
+        if self.open.ndim != 2:
+            raise ValueError("Maze must be a 2D grid")
+        self.height, self.width = self.open.shape
+        self.dots = np.argwhere(self.open)[:, ::-1].astype(np.int32)
+        self.powerups = np.asarray(powerups, dtype=np.int32).reshape(-1, 2)
+        self.ghost_spawns = np.asarray(ghost_spawns, dtype=np.int32).reshape(-1, 2)
+        if pacman_spawn is None:
+            if not len(self.dots):
+                raise ValueError("Maze has no open cells")
+            pacman_spawn = self.dots[0]
+        self.pacman_spawn = (int(pacman_spawn[0]), int(pacman_spawn[1]))
+        if not self.open[self.pacman_spawn[1], self.pacman_spawn[0]]:
+            raise ValueError(f"Pacman spawn {self.pacman_spawn} is inside a wall")
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def to_lines(self):
+        chars = np.where(self.open, ord(" "), ord(WALL)).astype(np.uint8)
+        for cells, char in ((self.powerups, POWERUP), (self.ghost_spawns, GHOST)):
+            chars[cells[:, 1], cells[:, 0]] = ord(char)
+        chars[self.pacman_spawn[1], self.pacman_spawn[0]] = ord(PACMAN)
+        return [row.tobytes().decode("ascii") for row in chars]
+
+    def to_bytes(self):
+        header = HEADER.pack(MAGIC, self.width, self.height, len(self.powerups), len(self.ghost_spawns),
+                             *self.pacman_spawn)
+        return (header + np.packbits(self.open, axis=None).tobytes() + self.powerups.astype("<i4").tobytes()
+                + self.ghost_spawns.astype("<i4").tobytes())
+
+
+def compile_maze(lines):
+    # Rows shorter than the widest one are padded with walls, editors like to strip trailing spaces
+    lines = [line.rstrip("\r\n") for line in lines]
+    while lines and not lines[-1]:
+        lines.pop()
+    if not lines:
+        raise ValueError("Maze is empty")
+    width = max(len(line) for line in lines)
+    text = "".join(line.ljust(width, WALL) for line in lines).encode("ascii")
+    chars = np.frombuffer(text, dtype=np.uint8).reshape(len(lines), width)
+
+    def cells(char):
+        return np.argwhere(chars == ord(char))[:, ::-1]
+
+    pacman = cells(PACMAN)
+    if len(pacman) > 1:
+        raise ValueError(f"Maze has {len(pacman)} Pacman spawns")
+    return Maze(chars != ord(WALL), cells(POWERUP), cells(GHOST), pacman[0] if len(pacman) else None)
+
+
+def decode_maze(data: bytes):
+    magic, width, height, powerups, ghosts, pacman_x, pacman_y = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary maze")
+    offset = HEADER.size
+    packed = (width * height + 7) // 8
+    bits = np.frombuffer(data, dtype=np.uint8, count=packed, offset=offset)
+    open_cells = np.unpackbits(bits, count=width * height).reshape(height, width)
+    offset += packed
+    coordinates = np.frombuffer(data, dtype="<i4", count=2 * (powerups + ghosts), offset=offset).reshape(-1, 2)
+    return Maze(open_cells, coordinates[:powerups], coordinates[powerups:], (pacman_x, pacman_y))
+
+
+def load_maze(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith(MAGIC):
+        return decode_maze(data)
+    return compile_maze(data.decode("ascii").splitlines())
+
+
+def save_maze(maze: Maze, path):
+    # Text for .txt files, the packed binary format for anything else
+    if path.endswith(".txt"):
+        with open(path, "w") as f:
+            f.write("\n".join(maze.to_lines()) + "\n")
+    else:
+        with open(path, "wb") as f:
+            f.write(maze.to_bytes())
+
+
+def generate_maze(width, height, seed=None, braid=0.5, powerups=4, ghosts=4):
+    # Randomised depth-first search over the cells at odd coordinates, then braiding: a share of the
+    # dead ends gets a wall knocked out so the maze has loops to run around, like a real Pacman maze.
+    if width < 5 or height < 5:
+        raise ValueError("Generated mazes are at least 5x5")
+    rng = np.random.default_rng(seed)
+    columns = (width - 1) // 2
+    rows = (height - 1) // 2
+
+    # Cells live in a grid padded by one visited cell on each side, so the search needs no bounds checks
+    stride = columns + 2
+    visited = np.ones((rows + 2, stride), dtype=np.uint8)
+    visited[1:-1, 1:-1] = 0
+    visited = bytearray(visited.tobytes())
+    steps = (-stride, stride, -1, 1)
+    orders = DIRECTION_ORDERS[rng.integers(0, len(DIRECTION_ORDERS), size=len(visited))].tolist()
+    tried = bytearray(len(visited))
+
+    carved_cells = []
+    carved_directions = []
+    start = stride + 1
+    visited[start] = 1
+    stack = [start]
+    while stack:
+        cell = stack[-1]
+        attempt = tried[cell]
+        if attempt == 4:
+            stack.pop()
+            continue
+        tried[cell] = attempt + 1
+        direction = orders[cell][attempt]
+        neighbour = cell + steps[direction]
+        if not visited[neighbour]:
+            visited[neighbour] = 1
+            carved_cells.append(cell)
+            carved_directions.append(direction)
+            stack.append(neighbour)
+
+    open_cells = np.zeros((height, width), dtype=np.bool_)
+    open_cells[1:2 * rows:2, 1:2 * columns:2] = True
+    cell_ys, cell_xs = np.divmod(np.array(carved_cells, dtype=np.int64), stride)
+    # Direction order matches steps: up, down, left, right
+    direction_x = np.array([0, 0, -1, 1])
+    direction_y = np.array([-1, 1, 0, 0])
+    carved_directions = np.array(carved_directions, dtype=np.int64)
+    open_cells[2 * cell_ys - 1 + direction_y[carved_directions], 2 * cell_xs - 1 + direction_x[carved_directions]] = True
+
+    if braid > 0:
+        braid_dead_ends(open_cells, rows, columns, braid, rng)
+
+    open_list = np.argwhere(open_cells)[:, ::-1]
+    centre = np.array([width // 2, height // 2])
+    by_centre = np.argsort(np.abs(open_list - centre).sum(axis=1), kind="stable")
+    ghost_spawns = np.sort(by_centre[:ghosts])
+    pacman_spawn = (1, 1)
+    # Powerups never share a cell with a spawn, the text format could not tell them apart
+    free = np.ones(len(open_list), dtype=np.bool_)
+    free[ghost_spawns] = False
+    free[(open_list[:, 0] == pacman_spawn[0]) & (open_list[:, 1] == pacman_spawn[1])] = False
+    candidates = open_list[free]
+    chosen = rng.choice(len(candidates), size=min(powerups, len(candidates)), replace=False)
+    return Maze(open_cells, candidates[np.sort(chosen)], open_list[ghost_spawns], pacman_spawn)
+
+
+def braid_dead_ends(open_cells, rows, columns, braid, rng):
+    centres = open_cells[1:2 * rows:2, 1:2 * columns:2]
+    padded = np.pad(open_cells, 1)
+    # Walls next to every cell centre, up, down, left, right, and whether a cell lies beyond them
+    walls = np.stack([
+        ~padded[1:2 * rows:2, 2:2 * columns + 1:2],
+        ~padded[3:2 * rows + 2:2, 2:2 * columns + 1:2],
+        ~padded[2:2 * rows + 1:2, 1:2 * columns:2],
+        ~padded[2:2 * rows + 1:2, 3:2 * columns + 2:2],
+    ])
+    inside = np.ones_like(walls)
+    inside[0, 0, :] = False
+    inside[1, -1, :] = False
+    inside[2, :, 0] = False
+    inside[3, :, -1] = False
+
+    dead_ends = centres & ((~walls).sum(axis=0) == 1) & (rng.random(centres.shape) < braid)
+    # Pick one random breakable wall per dead end
+    keys = np.where(walls & inside, rng.random(walls.shape), -1.0)
+    direction = keys.argmax(axis=0)
+    dead_ends &= keys.max(axis=0) >= 0
+
+    ys, xs = np.nonzero(dead_ends)
+    direction = direction[ys, xs]
+    offset_x = np.array([0, 0, -1, 1])[direction]
+    offset_y = np.array([-1, 1, 0, 0])[direction]
+    open_cells[2 * ys + 1 + offset_y, 2 * xs + 1 + offset_x] = True
@@ -1,14 +1,143 @@
-import numpy as np
-from node import astar
+from array import array
+from collections import OrderedDict
+
+from grid import MazeGrid
+from instrumentation import instruments
+from junction import JunctionGraph
+from routing import RoutingTable, UNREACHABLE
+from search import GridAStar
+from utils import PathMode, translate_to_screen
+
+
+class CellPath:
+    # Immutable sequence of (x, y) maze cells. Instances are shared between agents through the path
+    # cache, so they are never modified after construction.
+    __slots__ = ("_xs", "_ys")
+
+    def __init__(self, cells=()):
+        self._xs = array('i', [cell[0] for cell in cells])
+        self._ys = array('i', [cell[1] for cell in cells])
+
+    def __len__(self):
+        return len(self._xs)
+
+    def __getitem__(self, i):
+        return self._xs[i], self._ys[i]
+
+    def __iter__(self):
+        return zip(self._xs, self._ys)
+
+    def __repr__(self):
+        return f"CellPath({list(self)})"
+
+    def screen(self, i, size=32):
+        return translate_to_screen((self._xs[i], self._ys[i]), size)
+
+
+EMPTY_PATH = CellPath()
+
+
+class PathCursor:
+    # Read position into a shared CellPath, replaces copying the path into a list and pop(0)-ing it.
+    __slots__ = ("path", "position")
+
+    def __init__(self, path: CellPath = EMPTY_PATH):
+        self.path = path
+        self.position = 0
+
+    def __len__(self):
+        return len(self.path) - self.position
+
+    def next(self):
+        if self.position >= len(self.path):
+            return None
+        location = self.path.screen(self.position)
+        self.position += 1
+        return location
 
 
 class Path:
-    def __init__(self, in_arr):
-        self.maze = np.array(in_arr, dtype=np.bool_).tolist()
+    def __init__(self, in_arr, mode: PathMode = PathMode.SEARCH, cache_size=1024):
+        self.mode = mode
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.calls = 0
+        # Nodes the last get_path expanded, 0 when it came from the cache or the routing table
+        self.expanded = 0
+        self.set_maze(in_arr)
+
+    def set_maze(self, in_arr):
+        self.grid = MazeGrid(in_arr)
+        self.search = GridAStar(self.grid)
+        # Precomputed routing answers every query with a table walk instead of a search
+        self.routing = RoutingTable(self.grid) if self.mode == PathMode.TABLE else None
+        # Searching the junctions and corridors of the maze instead of its cells
+        self.junctions = JunctionGraph(self.grid) if self.mode == PathMode.JUNCTION else None
+        self.invalidate()
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def get_path(self, from_x, from_y, to_x, to_y) -> CellPath:
+        self.calls += 1
+        self.expanded = 0
+        grid = self.grid
+        if not grid.in_bounds(from_x, from_y) or not grid.in_bounds(to_x, to_y):
+            return EMPTY_PATH
+
+        start = grid.index(from_x, from_y)
+        goal = grid.index(to_x, to_y)
+        key = (start, goal)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            instruments.count("cache_hits")
+            self.cache.move_to_end(key)
+            return cached
+
+        self.misses += 1
+        with instruments.phase("pathfinding"):
+            if self.routing is not None and start != goal:
+                res = self.routing.get_path(start, goal)
+            elif self.junctions is not None:
+                res = self.junctions.search(start, goal)
+                self.expanded = self.junctions.expanded
+                instruments.count("astar_calls")
+                instruments.count("nodes_expanded", self.expanded)
+            else:
+                res = self.search.search(start, goal)
+                self.expanded = self.search.expanded
+                instruments.count("astar_calls")
+                instruments.count("nodes_expanded", self.expanded)
+            path = EMPTY_PATH if res is None else CellPath([grid.coordinates(index) for index in res])
+        instruments.count("path_length", len(path))
+
+        self.cache[key] = path
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return path
+
+    def get_distance(self, from_x, from_y, to_x, to_y):
+        grid = self.grid
+        if not grid.in_bounds(from_x, from_y) or not grid.in_bounds(to_x, to_y):
+            return UNREACHABLE
 
-    def get_path(self, from_x, from_y, to_x, to_y) -> object:
-        res = astar(self.maze, (from_y, from_x), (to_y, to_x))
-        if res is None:
-            return []
-        return [(sub[1], sub[0]) for sub in res]
+        start = grid.index(from_x, from_y)
+        goal = grid.index(to_x, to_y)
+        if self.routing is not None:
+            return self.routing.get_distance(start, goal)
+        search = self.junctions if self.junctions is not None else self.search
+        res = search.search(start, goal)
+        return UNREACHABLE if res is None else len(res) - 1
 
+    def cache_stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.cache),
+        }
@@ -0,0 +1,69 @@
+import numpy as np
+
+from grid import MazeGrid
+
+DOT = 1
+POWERUP = 2
+
+
+class PickupGrid:
+    # Dots and powerups as bit flags per maze cell. Picking something up is one lookup at a cell and
+    # the number of dots left is kept up to date, so nothing ever scans a list of objects.
+    def __init__(self, grid: MazeGrid):
+        self.grid = grid
+        self.cells = bytearray(grid.size)
+        self.dot_count = 0
+        self.powerup_count = 0
+        # Bumped on every change so cached views of the pickups know when they are stale, overall and per kind
+        self.version = 0
+        self.versions = {DOT: 0, POWERUP: 0}
+        # Cells taken of each kind, oldest first. A view that has seen n of them at version v and finds
+        # version - v equal to len(taken) - n knows that nothing but those takes happened since.
+        self.taken = {DOT: [], POWERUP: []}
+
+    def add(self, x, y, kind):
+        index = self.grid.index(x, y)
+        if self.cells[index] & kind:
+            return
+        self.cells[index] |= kind
+        if kind == DOT:
+            self.dot_count += 1
+        else:
+            self.powerup_count += 1
+        self.version += 1
+        self.versions[kind] += 1
+
+    def has(self, x, y, kind):
+        return self.grid.in_bounds(x, y) and bool(self.cells[self.grid.index(x, y)] & kind)
+
+    def take(self, x, y, kind):
+        if not self.has(x, y, kind):
+            return False
+        index = self.grid.index(x, y)
+        self.cells[index] &= ~kind
+        if kind == DOT:
+            self.dot_count -= 1
+        else:
+            self.powerup_count -= 1
+        self.version += 1
+        self.versions[kind] += 1
+        self.taken[kind].append(index)
+        return True
+
+    def load(self, cells):
+        # Replaces every flag at once, for restoring a saved state
+        self.cells[:] = cells
+        flags = np.frombuffer(self.cells, dtype=np.uint8)
+        self.dot_count = int(np.count_nonzero(flags & DOT))
+        self.powerup_count = int(np.count_nonzero(flags & POWERUP))
+        self.version += 1
+        for kind in self.versions:
+            self.versions[kind] += 1
+
+    def indices(self, kind):
+        flags = np.frombuffer(self.cells, dtype=np.uint8)
+        return np.flatnonzero(flags & kind).tolist()
+
+    def positions(self, kind):
+        # Only the set cells are turned back into coordinates
+        return [self.grid.coordinates(index) for index in self.indices(kind)]
@@ -0,0 +1,267 @@
+import math
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from time import perf_counter
+
+from path import Path, CellPath
+from utils import PathMode
+
+# The Path of a planner process, built once by the pool initializer
+process_path = None
+
+
+def init_process(maze, mode):
+    global process_path
+    process_path = Path(maze, mode)
+
+
+def plan_in_process(start, goal):
+    return process_path.get_path(start[0], start[1], goal[0], goal[1])
+
+
+class PlanRequest:
+    __slots__ = ("owner", "start", "goal", "future", "submitted", "stale")
+
+    def __init__(self, owner, start, goal):
+        self.owner = owner
+        self.start = start
+        self.goal = goal
+        self.future = None
+        self.submitted = perf_counter()
+        # Set when a newer request replaces this one while it is already running
+        self.stale = False
+
+
+class PathPlanner:
+    # Runs path searches on a thread or process pool so a slow search never stalls a tick. Every owner
+    # has at most one request in flight: asking again for a different goal cancels the old request, or
+    # marks it stale if a worker has already started on it, and its result is then thrown away.
+    def __init__(self, maze, mode: PathMode = PathMode.SEARCH, workers: int = 1, processes: bool = False,
+                 latency_window: int = 4096):
+        self.maze = maze
+        self.mode = mode
+        # Each worker thread searches with a Path of its own, GridAStar and the cache are not thread safe
+        self.local = threading.local()
+        if processes:
+            self.executor = ProcessPoolExecutor(workers, initializer=init_process, initargs=(maze, mode))
+            self.plan = plan_in_process
+        else:
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix="planner")
+            self.plan = self.plan_in_thread
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        self.submitted = 0
+        self.finished = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.discarded = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.depth_total = 0
+        # Latencies of the most recent completed requests, appended to by the worker callbacks
+        self.latencies = deque(maxlen=latency_window)
+
+    def plan_in_thread(self, start, goal):
+        path = getattr(self.local, "path", None)
+        if path is None:
+            path = self.local.path = Path(self.maze, self.mode)
+        return path.get_path(start[0], start[1], goal[0], goal[1])
+
+    def submit(self, owner, start, goal):
+        request = self.pending.get(owner)
+        if request is not None:
+            if request.goal == goal:
+                return request.future
+            self.cancel(owner)
+
+        request = PlanRequest(owner, start, goal)
+        depth = self.depth()
+        self.max_depth = max(self.max_depth, depth + 1)
+        self.depth_total += depth + 1
+        self.submitted += 1
+        request.future = self.executor.submit(self.plan, start, goal)
+        request.future.add_done_callback(lambda future: self.finish(request, future))
+        self.pending[owner] = request
+        return request.future
+
+    def finish(self, request, future):
+        # Runs on whichever thread completes the future
+        with self.lock:
+            self.finished += 1
+            if future.cancelled():
+                self.cancelled += 1
+            elif request.stale:
+                self.discarded += 1
+            elif future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+                self.latencies.append(perf_counter() - request.submitted)
+
+    def cancel(self, owner):
+        request = self.pending.pop(owner, None)
+        if request is not None and not request.future.cancel():
+            request.stale = True
+
+    def is_planning(self, owner):
+        return owner in self.pending
+
+    def collect(self, owner):
+        # The request's start cell and path once the owner's search is done, None while it is running. A
+        # search that raised is dropped too, the owner is no longer planning and asks for a new path.
+        request = self.pending.get(owner)
+        if request is None or not request.future.done():
+            return None
+        del self.pending[owner]
+        if request.future.exception() is not None:
+            return None
+        return request.start, request.future.result()
+
+    def depth(self):
+        # Requests submitted to the pool that have neither finished nor been cancelled
+        return self.submitted - self.finished
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        count = len(latencies)
+
+        def percentile(value):
+            return latencies[min(count - 1, count * value // 100)] * 1000 if count else 0.0
+
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "discarded": self.discarded,
+            "failed": self.failed,
+            "queue_depth": self.depth(),
+            "max_queue_depth": self.max_depth,
+            "mean_queue_depth": self.depth_total / self.submitted if self.submitted else 0.0,
+            "latency_mean_ms": sum(latencies) * 1000 / count if count else 0.0,
+            "latency_p50_ms": percentile(50),
+            "latency_p95_ms": percentile(95),
+            "latency_max_ms": latencies[-1] * 1000 if count else 0.0,
+        }
+
+    def shutdown(self):
+        for owner in list(self.pending):
+            self.cancel(owner)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class PathScheduler:
+    # Holds back the searches agents ask for during a tick and runs them together at its end. Requests
+    # for the same start and goal are searched once, the most urgent go first (Pacman, then the ghosts
+    # closest to him) and once the tick's time or node budget is spent the rest wait for a later tick.
+    # Every tick a request waits counts as one cell closer to Pacman, so far away ghosts are never
+    # starved. The first search of a tick always runs, whatever the budget.
+    def __init__(self, path: Path, budget_ms: float = None, budget_nodes: int = None):
+        self.path = path
+        self.budget = budget_ms / 1000 if budget_ms is not None else None
+        self.budget_nodes = budget_nodes
+        # Agent to [start, goal, ticks waited]; a newer request from the same agent replaces its goal
+        self.pending = {}
+
+        self.requested = 0
+        self.searched = 0
+        self.merged = 0
+        self.served = 0
+        self.deferred = 0
+        self.max_wait = 0
+        # Time spent in serve, which is all the budget bounds; the rest of the tick is not counted
+        self.ticks = 0
+        self.time_total = 0.0
+        self.worst_time = 0.0
+        self.worst_nodes = 0
+
+    def submit(self, agent, start, goal):
+        self.requested += 1
+        request = self.pending.get(agent)
+        if request is None:
+            self.pending[agent] = [start, goal, 0]
+        else:
+            request[1] = goal
+
+    def is_pending(self, agent):
+        return agent in self.pending
+
+    def is_deferred(self, agent):
+        # Pending since an earlier tick, the budget ran out before it
+        request = self.pending.get(agent)
+        return request is not None and request[2] > 0
+
+    def cancel(self, agent):
+        self.pending.pop(agent, None)
+
+    def serve(self, pacman):
+        if not self.pending:
+            return
+        started = perf_counter()
+        target = pacman.get_cell() if pacman is not None else None
+
+        def urgency(item):
+            agent, (_, _, waited) = item
+            if agent is pacman:
+                return -math.inf
+            if target is None:
+                return -waited
+            x, y = agent.get_cell()
+            return abs(x - target[0]) + abs(y - target[1]) - waited
+
+        path = self.path
+        results = {}
+        nodes = 0
+        for agent, request in sorted(self.pending.items(), key=urgency):
+            start, goal, waited = request
+            if waited:
+                # The agent has kept moving while it waited
+                start = agent.get_cell()
+            key = (start, goal)
+            result = results.get(key)
+            if result is None:
+                if results and ((self.budget is not None and perf_counter() - started >= self.budget)
+                                or (self.budget_nodes is not None and nodes >= self.budget_nodes)):
+                    continue
+                result = results[key] = path.get_path(start[0], start[1], goal[0], goal[1])
+                nodes += path.expanded
+                self.searched += 1
+            else:
+                self.merged += 1
+            del self.pending[agent]
+            self.served += 1
+            self.max_wait = max(self.max_wait, waited)
+            agent.set_new_path(result)
+
+        for request in self.pending.values():
+            request[2] += 1
+        self.deferred += len(self.pending)
+        elapsed = perf_counter() - started
+        self.ticks += 1
+        self.time_total += elapsed
+        self.worst_time = max(self.worst_time, elapsed)
+        self.worst_nodes = max(self.worst_nodes, nodes)
+
+    def stats(self):
+        return {
+            "requested": self.requested,
+            "searched": self.searched,
+            "merged": self.merged,
+            "served": self.served,
+            "deferred": self.deferred,
+            "waiting": len(self.pending),
+            "max_wait_ticks": self.max_wait,
+            "mean_serve_ms": self.time_total * 1000 / self.ticks if self.ticks else 0.0,
+            "worst_serve_ms": self.worst_time * 1000,
+            "worst_serve_nodes": self.worst_nodes,
+        }
+
+
+def follow_from(path: CellPath, cell):
+    # The part of a path that starts at cell, for agents that have moved on while it was planned
+    for i, step in enumerate(path):
+        if step == cell:
+            return path if i == 0 else CellPath(list(path)[i:])
+    return None
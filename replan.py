@@ -0,0 +1,141 @@
+from grid import MazeGrid
+from instrumentation import instruments
+from search import GridAStar
+
+
+class ChasePlanner:
+    # A ghost's path to Pacman, kept between calls. When Pacman moves, a bounded breadth-first search
+    # from his new cell looks for the path the ghost is already on and splices onto it, so only the end
+    # of the path is planned again. Full searches still run every full_interval repairs, and whenever
+    # the repair cannot find the old path, so repaired paths never drift far from the shortest ones.
+    def __init__(self, grid: MazeGrid, search: GridAStar, repair_limit: int = 64, full_interval: int = 8):
+        self.grid = grid
+        self.search = search
+        self.repair_limit = repair_limit
+        self.full_interval = full_interval
+        # Cells of the current path; path[base] is where the ghost was last seen on it
+        self.path = []
+        self.base = 0
+        # Position in self.path of every cell from base onwards
+        self.positions = {}
+        self.goal = None
+        self.repairs_since_full = 0
+
+        self.repairs = 0
+        self.failed_repairs = 0
+        # Includes the cells expanded by failed repairs, they are part of what repairing costs
+        self.repair_expanded = 0
+        self.full_searches = 0
+        self.full_expanded = 0
+
+    def reset(self):
+        self.path = []
+        self.base = 0
+        self.positions = {}
+        self.goal = None
+
+    def plan(self, start, goal):
+        # Cells from start to goal, both included, or None when goal cannot be reached
+        if not self.advance(start) or self.repairs_since_full >= self.full_interval or not self.repair(goal):
+            self.replan(start, goal)
+        return None if self.goal is None else self.path[self.base:]
+
+    def advance(self, start):
+        # Drop the cells the ghost has already walked past
+        position = self.positions.get(start)
+        if position is None:
+            return False
+        path = self.path
+        positions = self.positions
+        for cell in path[self.base:position]:
+            del positions[cell]
+        self.base = position
+        if position > 256:
+            self.path = path[position:]
+            self.base = 0
+            self.positions = {cell: i for i, cell in enumerate(self.path)}
+        return True
+
+    def repair(self, goal):
+        if goal == self.goal:
+            return True
+        positions = self.positions
+        position = positions.get(goal)
+        if position is not None:
+            # Pacman stepped onto the path, everything behind him can go
+            self.truncate(position)
+            self.goal = goal
+            self.repairs += 1
+            self.repairs_since_full += 1
+            return True
+
+        open_cells = self.grid.open
+        offsets = self.grid.offsets
+        parents = {goal: -1}
+        frontier = [goal]
+        expanded = 0
+        best = None
+        while frontier and best is None and expanded < self.repair_limit:
+            next_frontier = []
+            for cell in frontier:
+                expanded += 1
+                for offset in offsets:
+                    neighbour = cell + offset
+                    if not open_cells[neighbour] or neighbour in parents:
+                        continue
+                    parents[neighbour] = cell
+                    position = positions.get(neighbour)
+                    if position is None:
+                        next_frontier.append(neighbour)
+                    elif best is None or position < positions[best]:
+                        # Every hit on this level is equally far from Pacman, the earliest one is shortest
+                        best = neighbour
+            frontier = next_frontier
+
+        self.repair_expanded += expanded
+        if best is None:
+            self.failed_repairs += 1
+            return False
+
+        self.truncate(positions[best])
+        cell = parents[best]
+        while cell != -1:
+            positions[cell] = len(self.path)
+            self.path.append(cell)
+            cell = parents[cell]
+        self.goal = goal
+        self.repairs += 1
+        self.repairs_since_full += 1
+        return True
+
+    def truncate(self, position):
+        positions = self.positions
+        for cell in self.path[position + 1:]:
+            del positions[cell]
+        del self.path[position + 1:]
+
+    def replan(self, start, goal):
+        path = self.search.search(start, goal)
+        self.full_searches += 1
+        self.full_expanded += self.search.expanded
+        instruments.count("astar_calls")
+        instruments.count("nodes_expanded", self.search.expanded)
+        self.repairs_since_full = 0
+        if path is None:
+            self.reset()
+            return
+        self.path = path
+        self.base = 0
+        self.positions = {cell: i for i, cell in enumerate(path)}
+        self.goal = goal
+
+    def stats(self):
+        return {
+            "repairs": self.repairs,
+            "failed_repairs": self.failed_repairs,
+            "repair_expanded": self.repair_expanded,
+            "full_searches": self.full_searches,
+            "full_expanded": self.full_expanded,
+            "expanded_per_repair": self.repair_expanded / self.repairs if self.repairs else 0.0,
+            "expanded_per_search": self.full_expanded / self.full_searches if self.full_searches else 0.0,
+        }
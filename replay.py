@@ -0,0 +1,251 @@
+from array import array
+
+import numpy as np
+import pygame
+
+from maze import decode_maze
+from pickups import DOT, POWERUP
+from utils import Direction, GhostBehaviour
+
+# Directions and ghost modes are stored as their index in these tuples
+DIRECTIONS = tuple(Direction)
+MODES = tuple(GhostBehaviour)
+
+# Bits of the per-tick flags
+POWER = 1
+MOUTH_OPEN = 2
+WON = 4
+GAME_OVER = 8
+
+# Position of an agent that has left the game
+GONE = -1
+
+
+class ReplayRecorder:
+    # Logs a game tick by tick into flat arrays: agent positions and directions, ghost mode, flags,
+    # score and lives, every pickup taken, and the whole pickup grid every snapshot_interval ticks.
+    # Frame 0 is the state before the first step and frame n the state after step n, which covers
+    # world.step_ticks ticks.
+    def __init__(self, game_engine, world, snapshot_interval: int = 600):
+        self.world = world
+        self.grid = world.grid
+        self.seed = game_engine.seed
+        self.maze_bytes = game_engine.maze.to_bytes()
+        self.snapshot_interval = snapshot_interval
+        self.step_ticks = world.step_ticks
+        # Ghost slots are fixed when recording starts
+        self.ghosts = list(world.get_ghosts())
+
+        self.pacman_x = array('i')
+        self.pacman_y = array('i')
+        self.pacman_direction = array('b')
+        self.ghost_x = array('i')
+        self.ghost_y = array('i')
+        self.ghost_direction = array('b')
+        self.mode = array('b')
+        self.flags = array('b')
+        self.score = array('i')
+        self.lives = array('i')
+        self.event_frame = array('i')
+        self.event_cell = array('i')
+        self.event_kind = array('b')
+        self.snapshots = []
+        self.frames = 0
+
+        world.recorder = self
+        self.record()
+
+    def record_pickup(self, cell, kind):
+        # Pickups are taken during a tick, so they belong to the frame recorded at its end
+        self.event_frame.append(self.frames)
+        self.event_cell.append(self.grid.index(cell[0], cell[1]))
+        self.event_kind.append(kind)
+
+    def record(self):
+        world = self.world
+        pacman = world.pacman
+        if pacman is None:
+            self.pacman_x.append(GONE)
+            self.pacman_y.append(GONE)
+            self.pacman_direction.append(DIRECTIONS.index(Direction.NONE))
+        else:
+            self.pacman_x.append(pacman.x)
+            self.pacman_y.append(pacman.y)
+            self.pacman_direction.append(DIRECTIONS.index(pacman.current_direction))
+
+        alive = world.get_ghosts()
+        for ghost in self.ghosts:
+            if ghost in alive:
+                self.ghost_x.append(ghost.x)
+                self.ghost_y.append(ghost.y)
+            else:
+                self.ghost_x.append(GONE)
+                self.ghost_y.append(GONE)
+            self.ghost_direction.append(DIRECTIONS.index(ghost.current_direction))
+
+        self.mode.append(MODES.index(world.get_current_mode()))
+        flags = 0
+        if world.is_power_active():
+            flags |= POWER
+        if pacman is not None and pacman.mouth_open:
+            flags |= MOUTH_OPEN
+        if world.get_won():
+            flags |= WON
+        if pacman is None:
+            flags |= GAME_OVER
+        self.flags.append(flags)
+        self.score.append(world.score)
+        self.lives.append(world.lives)
+
+        if self.frames % self.snapshot_interval == 0:
+            self.snapshots.append(bytes(world.get_pickups().cells))
+        self.frames += 1
+
+    def save(self, path):
+        ghosts = len(self.ghosts)
+        np.savez_compressed(
+            path,
+            maze=np.frombuffer(self.maze_bytes, dtype=np.uint8),
+            meta=np.array([self.seed, self.snapshot_interval, ghosts, self.frames, self.step_ticks], dtype=np.int64),
+            pacman=np.stack([np.frombuffer(self.pacman_x, dtype=np.int32),
+                             np.frombuffer(self.pacman_y, dtype=np.int32)], axis=1),
+            pacman_direction=np.frombuffer(self.pacman_direction, dtype=np.int8),
+            ghosts=np.stack([np.frombuffer(self.ghost_x, dtype=np.int32),
+                             np.frombuffer(self.ghost_y, dtype=np.int32)], axis=1).reshape(self.frames, ghosts, 2),
+            ghost_direction=np.frombuffer(self.ghost_direction, dtype=np.int8).reshape(self.frames, ghosts),
+            mode=np.frombuffer(self.mode, dtype=np.int8),
+            flags=np.frombuffer(self.flags, dtype=np.int8),
+            score=np.frombuffer(self.score, dtype=np.int32),
+            lives=np.frombuffer(self.lives, dtype=np.int32),
+            events=np.stack([np.frombuffer(self.event_frame, dtype=np.int32),
+                             np.frombuffer(self.event_cell, dtype=np.int32),
+                             np.frombuffer(self.event_kind, dtype=np.int8).astype(np.int32)], axis=1).reshape(-1, 3),
+            snapshots=np.frombuffer(b"".join(self.snapshots), dtype=np.uint8).reshape(len(self.snapshots), -1),
+        )
+
+
+class ReplayFrame:
+    __slots__ = ("tick", "pacman", "pacman_direction", "ghosts", "ghost_directions", "mode", "power",
+                 "mouth_open", "won", "game_over", "score", "lives", "cells")
+
+    def __init__(self, player, tick, cells):
+        self.tick = tick
+        x, y = player.pacman[tick].tolist()
+        self.pacman = None if x == GONE else (x, y)
+        self.pacman_direction = DIRECTIONS[player.pacman_direction[tick]]
+        self.ghosts = [None if x == GONE else (x, y) for x, y in player.ghosts[tick].tolist()]
+        self.ghost_directions = [DIRECTIONS[direction] for direction in player.ghost_direction[tick].tolist()]
+        self.mode = MODES[player.mode[tick]]
+        flags = int(player.flags[tick])
+        self.power = bool(flags & POWER)
+        self.mouth_open = bool(flags & MOUTH_OPEN)
+        self.won = bool(flags & WON)
+        self.game_over = bool(flags & GAME_OVER)
+        self.score = int(player.score[tick])
+        self.lives = int(player.lives[tick])
+        # Shared with the player and updated in place as it moves on, copy it to keep it
+        self.cells = cells
+
+
+class ReplayPlayer:
+    # Plays a recording back without simulating anything. Positions are read straight from the per-tick
+    # arrays; the pickups at a tick are the nearest snapshot before it plus the pickups taken since,
+    # so seeking costs at most one snapshot interval of events.
+    def __init__(self, path):
+        with np.load(path) as data:
+            for name in data.files:
+                setattr(self, name, data[name])
+        self.seed, self.snapshot_interval, ghosts, self.frames, self.step_ticks = (int(value) for value in self.meta)
+        self.maze = decode_maze(self.maze.tobytes())
+        self.event_frames = self.events[:, 0]
+        self.cells = bytearray()
+        self.tick = -1
+
+    def __len__(self):
+        return self.frames
+
+    def seek(self, tick):
+        if not 0 <= tick < self.frames:
+            raise IndexError(f"Tick {tick} is outside the recording of {self.frames} frames")
+        snapshot = tick // self.snapshot_interval
+        self.cells = bytearray(self.snapshots[snapshot].tobytes())
+        self.apply_events(snapshot * self.snapshot_interval, tick)
+        self.tick = tick
+        return ReplayFrame(self, tick, self.cells)
+
+    def next(self):
+        # The following frame, only applying the pickups taken on it
+        if self.tick < 0:
+            return self.seek(0)
+        if self.tick + 1 >= self.frames:
+            return None
+        self.tick += 1
+        self.apply_events(self.tick - 1, self.tick)
+        return ReplayFrame(self, self.tick, self.cells)
+
+    def apply_events(self, after, until):
+        first, last = np.searchsorted(self.event_frames, (after + 1, until + 1))
+        cells = self.cells
+        for _, cell, kind in self.events[first:last].tolist():
+            cells[cell] &= ~kind
+
+    def frames_from(self, start=0, end=None, step=1):
+        # Headless playback at any speed: step > 1 skips frames, seeking whenever it does
+        end = self.frames if end is None else min(end, self.frames)
+        frame = self.seek(start)
+        while frame is not None and frame.tick < end:
+            yield frame
+            frame = self.next() if step == 1 else (self.seek(frame.tick + step) if frame.tick + step < end else None)
+
+    def render(self, start=0, speed=1.0, fps=120):
+        # Shows the recording in a window, driving a World built from the recorded maze
+        from main import create_game
+        _, world = create_game(seed=self.seed, maze=self.maze, cell_steps=self.step_ticks > 1)
+        ghosts = list(world.get_ghosts())
+        step = max(1, int(speed))
+        frame_rate = fps * speed / step / self.step_ticks
+        previous = None
+        for frame in self.frames_from(start, step=step):
+            if previous is None or frame.tick != previous + 1:
+                self.show_pickups(world)
+            self.show_frame(world, ghosts, frame)
+            previous = frame.tick
+            world.render()
+            world.clock.tick(frame_rate)
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                break
+
+    def show_pickups(self, world):
+        # After a seek the pickup layer is rebuilt from the grid on the next render
+        world.get_pickups().load(self.cells)
+        world.background = None
+
+    def show_frame(self, world, ghosts, frame):
+        for _, cell, kind in self.events[np.searchsorted(self.event_frames, frame.tick):
+                                         np.searchsorted(self.event_frames, frame.tick + 1)].tolist():
+            position = world.grid.coordinates(cell)
+            if kind == DOT:
+                world.take_cookie(position)
+            elif kind == POWERUP:
+                world.take_powerup(position)
+
+        pacman = world.pacman
+        if pacman is not None:
+            if frame.pacman is None:
+                world.end_game()
+            else:
+                pacman.set_position(*frame.pacman)
+                pacman.current_direction = frame.pacman_direction
+                pacman.mouth_open = frame.mouth_open
+        for ghost, position, direction in zip(ghosts, frame.ghosts, frame.ghost_directions):
+            if position is None:
+                if ghost in world.get_ghosts():
+                    world.remove_ghost(ghost)
+            else:
+                ghost.set_position(*position)
+                ghost.current_direction = direction
+        world.set_current_mode(frame.mode)
+        world.power_active = frame.power
+        world.won = frame.won
+        world.score = frame.score
+        world.lives = frame.lives
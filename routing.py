@@ -0,0 +1,94 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from grid import MazeGrid
+
+UNREACHABLE = -1
+NO_HOP = np.iinfo(np.uint16).max
+
+
+class RoutingTable:
+    # All-pairs shortest paths for a static maze. Every open cell gets a compact id; distance[a, b] is
+    # the number of steps between a and b and next_hop[b, a] is the cell to step to from a towards b.
+    # Distances are int16, and a path can be as long as the maze has open cells.
+    MAX_CELLS = np.iinfo(np.int16).max
+
+    def __init__(self, grid: MazeGrid):
+        self.grid = grid
+        started = time.perf_counter()
+
+        self.cells = grid.open_indices()
+        count = len(self.cells)
+        if count > self.MAX_CELLS:
+            raise ValueError(f"Maze has {count} open cells, the routing table supports at most {self.MAX_CELLS}")
+
+        self.compact = np.full(grid.size, -1, dtype=np.int32)
+        self.compact[self.cells] = np.arange(count, dtype=np.int32)
+        compact = self.compact.tolist()
+        adjacency = [[compact[n] for n in grid.neighbours(cell)] for cell in self.cells]
+
+        self.distance = np.full((count, count), UNREACHABLE, dtype=np.int16)
+        self.next_hop = np.full((count, count), NO_HOP, dtype=np.uint16)
+        for target in range(count):
+            distances, hops = self._bfs(adjacency, target)
+            self.distance[target] = distances
+            self.next_hop[target] = hops
+
+        self.build_time = time.perf_counter() - started
+
+    @staticmethod
+    def _bfs(adjacency, source):
+        # The maze is undirected, so the parent of each cell in a BFS from the target is exactly the
+        # next hop from that cell towards the target.
+        distances = [UNREACHABLE] * len(adjacency)
+        hops = [NO_HOP] * len(adjacency)
+        distances[source] = 0
+        hops[source] = source
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            next_distance = distances[current] + 1
+            for neighbour in adjacency[current]:
+                if distances[neighbour] == UNREACHABLE:
+                    distances[neighbour] = next_distance
+                    hops[neighbour] = current
+                    queue.append(neighbour)
+        return distances, hops
+
+    @staticmethod
+    def estimate_bytes(cell_count):
+        return cell_count * cell_count * (np.dtype(np.int16).itemsize + np.dtype(np.uint16).itemsize)
+
+    @property
+    def nbytes(self):
+        return self.distance.nbytes + self.next_hop.nbytes + self.compact.nbytes
+
+    def get_distance(self, start, goal):
+        a = self.compact[start]
+        b = self.compact[goal]
+        if a < 0 or b < 0:
+            return UNREACHABLE
+        return int(self.distance[b, a])
+
+    def get_path(self, start, goal):
+        a = int(self.compact[start])
+        b = int(self.compact[goal])
+        if a < 0 or b < 0 or self.distance[b, a] == UNREACHABLE:
+            return None
+
+        hops = self.next_hop[b]
+        cells = self.cells
+        path = [cells[a]]
+        while a != b:
+            a = int(hops[a])
+            path.append(cells[a])
+        return path
+
+    def stats(self):
+        return {
+            "cells": len(self.cells),
+            "build_time": self.build_time,
+            "bytes": self.nbytes,
+        }
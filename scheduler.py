@@ -0,0 +1,48 @@
+from heapq import heappush, heappop
+
+
+class TickScheduler:
+    # Stand-in for pygame.time.set_timer that counts simulation ticks instead of wall-clock time.
+    # Timers repeat, setting a timer again replaces it and a delay of 0 cancels it, just like pygame.
+    def __init__(self, fps: int = 120):
+        self.fps = fps
+        self.tick = 0
+        self.queue = []
+        self.generations = {}
+        self.sequence = 0
+
+    def to_ticks(self, millis):
+        return max(1, round(millis * self.fps / 1000))
+
+    def set_timer(self, event_type, millis):
+        generation = self.generations.get(event_type, 0) + 1
+        self.generations[event_type] = generation
+        if millis <= 0:
+            return
+
+        interval = self.to_ticks(millis)
+        self.push(self.tick + interval, event_type, generation, interval)
+
+    def push(self, due, event_type, generation, interval):
+        # The sequence number keeps events that fall on the same tick in the order they were scheduled
+        self.sequence += 1
+        heappush(self.queue, (due, self.sequence, event_type, generation, interval))
+
+    def remaining(self, event_type):
+        # Ticks until the timer next fires, None when it is not set
+        generation = self.generations.get(event_type)
+        due = [entry[0] for entry in self.queue if entry[2] == event_type and entry[3] == generation]
+        return min(due) - self.tick if due else None
+
+    def advance(self, ticks: int = 1):
+        self.tick += ticks
+        due_events = []
+        queue = self.queue
+        while queue and queue[0][0] <= self.tick:
+            due, _, event_type, generation, interval = heappop(queue)
+            # Lazy deletion: entries of replaced or cancelled timers are dropped when they surface
+            if self.generations.get(event_type) != generation:
+                continue
+            due_events.append(event_type)
+            self.push(due + interval, event_type, generation, interval)
+        return due_events
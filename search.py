@@ -0,0 +1,79 @@
+from heapq import heappush, heappop
+
+from grid import MazeGrid
+
+
+class GridAStar:
+    # A* over the flat cell indices of a MazeGrid. The score arrays are allocated once and reused by
+    # every search; a per-search stamp tells which entries are valid, so nothing has to be cleared.
+    def __init__(self, grid: MazeGrid):
+        self.grid = grid
+        self.g_score = [0] * grid.size
+        self.parent = [-1] * grid.size
+        self.seen = [0] * grid.size
+        self.closed = [0] * grid.size
+        self.search_id = 0
+        self.expanded = 0
+
+    def search(self, start, goal):
+        grid = self.grid
+        if start == goal:
+            self.expanded = 0
+            return [start]
+        if not grid.open[goal]:
+            self.expanded = 0
+            return None
+
+        self.search_id += 1
+        search_id = self.search_id
+        open_cells = grid.open
+        offsets = grid.offsets
+        stride = grid.stride
+        g_score = self.g_score
+        parent = self.parent
+        seen = self.seen
+        closed = self.closed
+        goal_y, goal_x = divmod(goal, stride)
+
+        g_score[start] = 0
+        parent[start] = -1
+        seen[start] = search_id
+        start_y, start_x = divmod(start, stride)
+        start_h = abs(start_x - goal_x) + abs(start_y - goal_y)
+        open_list = [(start_h, start_h, start)]
+        expanded = 0
+
+        while open_list:
+            current = heappop(open_list)[2]
+            # Lazy deletion: a cell may sit in the heap several times, only the first pop counts
+            if closed[current] == search_id:
+                continue
+            closed[current] = search_id
+            expanded += 1
+
+            if current == goal:
+                self.expanded = expanded
+                path = []
+                while current != -1:
+                    path.append(current)
+                    current = parent[current]
+                return path[::-1]
+
+            new_g = g_score[current] + 1
+            for offset in offsets:
+                neighbour = current + offset
+                if not open_cells[neighbour] or closed[neighbour] == search_id:
+                    continue
+                if seen[neighbour] == search_id and g_score[neighbour] <= new_g:
+                    continue
+
+                seen[neighbour] = search_id
+                g_score[neighbour] = new_g
+                parent[neighbour] = current
+                y, x = divmod(neighbour, stride)
+                h = abs(x - goal_x) + abs(y - goal_y)
+                # Ties on f are broken towards the goal, which keeps the expansion count low
+                heappush(open_list, (new_g + h, h, neighbour))
+
+        self.expanded = expanded
+        return None
@@ -0,0 +1,25 @@
+from main import create_game
+from utils import ChaseStrategy, GhostBehaviour, translate_to_maze
+
+
+def test_incremental_chase_resumes_after_patrol():
+    # Pacman stands still, so the goal of the second chase is the goal of the first one, and the ghost must
+    # still leave the patrol path it took in between
+    game, world = create_game(headless=True, seed=5, chase_strategy=ChaseStrategy.INCREMENTAL)
+    world.pacman.controlled = True
+    pacman_cell = translate_to_maze(world.get_pacman_position())
+    ghost = world.get_ghosts()[0]
+    for _ in range(64):
+        world.step()
+    assert ghost.location_queue.path[-1] == pacman_cell
+
+    world.set_current_mode(GhostBehaviour.PATROL)
+    game.request_new_random_path(ghost)
+    for _ in range(64):
+        world.step()
+    assert ghost.location_queue.path[-1] != pacman_cell
+
+    world.set_current_mode(GhostBehaviour.CHASE)
+    for _ in range(64):
+        world.step()
+    assert ghost.location_queue.path[-1] == pacman_cell
@@ -0,0 +1,50 @@
+import random
+
+from fields import DistanceField, DistanceFields
+from grid import MazeGrid
+from maze import generate_maze
+from pickups import PickupGrid, DOT, POWERUP
+
+
+def test_removing_sources_matches_a_full_build():
+    grid = MazeGrid(generate_maze(41, 41, 3).open)
+    rng = random.Random(3)
+    sources = rng.sample(grid.open_indices(), 60)
+    field = DistanceField(grid)
+    field.build(sources)
+    rebuilt = DistanceField(grid)
+    while sources:
+        removed = [sources.pop(rng.randrange(len(sources))) for _ in range(min(len(sources), rng.randint(1, 4)))]
+        field.remove_sources(removed)
+        rebuilt.build(sources)
+        assert field.distances == rebuilt.distances
+
+
+def test_pickup_fields_follow_their_own_kind():
+    grid = MazeGrid(generate_maze(21, 21, 1).open)
+    pickups = PickupGrid(grid)
+    cells = [grid.coordinates(index) for index in grid.open_indices()]
+    for x, y in cells[:40]:
+        pickups.add(x, y, DOT)
+    for x, y in cells[40:43]:
+        pickups.add(x, y, POWERUP)
+    fields = DistanceFields(grid)
+    fields.dot_field(pickups)
+    fields.powerup_field(pickups)
+
+    # Eating dots leaves the powerup field alone and updates the dot field without a full build
+    for x, y in cells[:10]:
+        pickups.take(x, y, DOT)
+    assert fields.powerup_field(pickups).builds == 1
+    dots = fields.dot_field(pickups)
+    assert (dots.builds, dots.updates) == (1, 1)
+    expected = DistanceField(grid)
+    expected.build(pickups.indices(DOT))
+    assert dots.distances == expected.distances
+
+    # A dot put back is not a removal, the field is built again
+    pickups.add(*cells[0], DOT)
+    assert fields.dot_field(pickups).builds == 2
+    x, y = cells[40]
+    pickups.take(x, y, POWERUP)
+    assert fields.powerup_field(pickups).updates == 1
@@ -0,0 +1,44 @@
+import time
+
+from instrumentation import Instrumentation
+
+
+def test_nested_phases_are_exclusive():
+    instruments = Instrumentation(enabled=True)
+    started = time.perf_counter()
+    with instruments.phase("agents"):
+        time.sleep(0.01)
+        with instruments.phase("pathfinding"):
+            time.sleep(0.02)
+            # Entering a phase again inside itself must neither lose nor double count time
+            with instruments.phase("pathfinding"):
+                time.sleep(0.01)
+        with instruments.phase("collision"):
+            time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    totals = instruments.current
+
+    assert totals["agents"] >= 0.01
+    assert totals["pathfinding"] >= 0.03
+    assert totals["collision"] >= 0.01
+    assert abs(totals["agents"] + totals["pathfinding"] + totals["collision"] - elapsed) < 0.001
+    assert not instruments.stack
+
+
+def test_frames_are_recorded_apart_from_ticks():
+    # A windowed frame can take several steps, each of them is still a tick of its own
+    instruments = Instrumentation(enabled=True)
+    for _ in range(3):
+        with instruments.phase("agents"):
+            instruments.count("astar_calls")
+        instruments.end_tick()
+    with instruments.phase("render"):
+        time.sleep(0.01)
+    instruments.end_frame()
+
+    assert len(instruments.history) == 3
+    assert len(instruments.frame_history) == 1
+    assert all("render" not in tick for tick in instruments.history)
+    summary = instruments.summary()
+    assert summary["astar_calls"]["mean"] == 1
+    assert summary["render"]["mean"] >= 10
@@ -0,0 +1,43 @@
+from main import create_game
+from path import EMPTY_PATH
+from utils import GhostBehaviour
+
+
+def test_deferred_ghost_keeps_moving():
+    # With a one node budget only one search runs per tick, so ghosts that all need a path at once have to
+    # wait, and they should keep going the way they were going in the meantime
+    game, world = create_game(headless=True, seed=0, path_budget_nodes=1)
+    world.set_current_mode(GhostBehaviour.PATROL)
+    for _ in range(300):
+        world.step()
+    ghosts = world.get_ghosts()
+    for ghost in ghosts:
+        ghost.set_new_path(EMPTY_PATH)
+
+    deferred = 0
+    moved = 0
+    for _ in range(10):
+        before = {ghost: (ghost.get_position(), game.is_deferred(ghost)) for ghost in ghosts}
+        world.step()
+        for ghost, (position, was_deferred) in before.items():
+            if was_deferred:
+                deferred += 1
+                moved += ghost.get_position() != position
+            x, y = ghost.get_cell()
+            assert world.grid.open[world.grid.index(x, y)]
+    assert deferred > 0
+    assert moved == deferred
+    assert game.path_scheduler.stats()["deferred"] >= deferred
+
+
+def test_eaten_ghost_request_is_dropped():
+    game, world = create_game(headless=True, seed=0, path_budget_nodes=1)
+    ghost = world.get_ghosts()[0]
+    game.request_new_random_path(ghost)
+    assert game.is_planning(ghost)
+    world.remove_ghost(ghost)
+    assert not game.is_planning(ghost)
+    world.step()
+    # The other ghosts were served, the eaten one was not handed a path
+    assert game.path_scheduler.stats()["served"] > 0
+    assert ghost.next_target is None
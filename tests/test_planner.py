@@ -0,0 +1,39 @@
+import numpy as np
+
+from main import create_game
+from planner import PathPlanner
+
+
+def test_latencies_keep_a_bounded_window():
+    planner = PathPlanner(np.ones((8, 8), dtype=np.bool_), workers=2, latency_window=16)
+    for owner in range(64):
+        planner.submit(owner, (0, 0), (owner % 8, owner // 8)).result()
+    planner.shutdown()
+    stats = planner.stats()
+    assert stats["completed"] == 64
+    assert len(planner.latencies) == 16
+    assert stats["latency_max_ms"] >= stats["latency_p50_ms"]
+
+
+def test_failed_search_is_dropped():
+    planner = PathPlanner(np.ones((8, 8), dtype=np.bool_))
+
+    def fail(start, goal):
+        raise ValueError("no path")
+    planner.plan = fail
+    future = planner.submit("ghost", (0, 0), (7, 7))
+    future.exception()
+    assert planner.collect("ghost") is None
+    assert not planner.is_planning("ghost")
+    planner.shutdown()
+    assert planner.stats()["failed"] == 1
+
+
+def test_eaten_ghost_request_is_cancelled():
+    game, world = create_game(headless=True, seed=0, planner_workers=1)
+    ghost = world.get_ghosts()[0]
+    game.request_new_random_path(ghost)
+    assert game.is_planning(ghost)
+    world.remove_ghost(ghost)
+    assert not game.is_planning(ghost)
+    game.close()
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from grid import MazeGrid
+from main import GameEngine
+from path import Path
+from routing import RoutingTable
+from utils import PathMode
+
+
+def test_table_paths_match_search():
+    maze = Path(np.ones((6, 9), dtype=np.bool_))
+    table = Path(np.ones((6, 9), dtype=np.bool_), PathMode.TABLE)
+    assert len(table.get_path(0, 0, 8, 5)) == len(maze.get_path(0, 0, 8, 5))
+    assert table.get_distance(0, 0, 8, 5) == 13
+
+
+def test_too_many_cells_for_int16_distances():
+    # A single corridor one cell longer than int16 can count would overflow the distance row
+    corridor = np.ones((1, RoutingTable.MAX_CELLS + 1), dtype=np.bool_)
+    with pytest.raises(ValueError):
+        RoutingTable(MazeGrid(corridor))
+
+
+def test_game_engine_reports_routing_without_printing(capsys):
+    game = GameEngine(PathMode.TABLE)
+    assert capsys.readouterr().out == ""
+    stats = game.stats()
+    assert stats["routing"]["cells"] == len(game.p.routing.cells)
+    assert stats["junctions"] is None
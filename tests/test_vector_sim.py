@@ -0,0 +1,13 @@
+import pytest
+
+from benchmark import check_vector_consistency
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_vector_engine_matches_object_engine(seed):
+    check_vector_consistency(200, seed, ghosts=False)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_vector_ghosts_match_object_ghosts(seed):
+    check_vector_consistency(200, seed)
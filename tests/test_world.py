@@ -0,0 +1,22 @@
+import numpy as np
+
+from grid import MazeGrid
+from world import World, CELL_SIZE, WALL_COLOR
+
+
+def test_world_pickups_come_with_its_grid():
+    world = World(MazeGrid(np.ones((3, 4), dtype=np.bool_)), headless=True)
+    assert (world.width, world.height) == (4 * CELL_SIZE, 3 * CELL_SIZE)
+    world.add_cookie((1, 2))
+    assert not world.check_all_dots_collected()
+    assert world.take_cookie((1, 2))
+    assert world.check_all_dots_collected()
+
+
+def test_background_walls_come_from_the_grid():
+    maze = np.ones((3, 4), dtype=np.bool_)
+    maze[1, 2] = False
+    world = World(MazeGrid(maze))
+    world.render()
+    assert tuple(world.background.get_at((2 * CELL_SIZE + CELL_SIZE // 2, CELL_SIZE + CELL_SIZE // 2)))[:3] == WALL_COLOR
+    assert tuple(world.background.get_at((CELL_SIZE // 2, CELL_SIZE // 2)))[:3] == (0, 0, 0)
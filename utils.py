@@ -9,6 +9,16 @@ class Direction(Enum):
     NONE = (0, 0)
 
 
+# Bit of each direction in the per-cell legal move masks of grid.MazeGrid
+DIRECTION_BITS = {
+    Direction.UP: 1,
+    Direction.DOWN: 2,
+    Direction.LEFT: 4,
+    Direction.RIGHT: 8,
+    Direction.NONE: 0,
+}
+
+
 class ScoreType(Enum):
     DOT = 10
     POWERUP = 50
@@ -20,6 +30,18 @@ class GhostBehaviour(Enum):
     PATROL = 2
 
 
+class PathMode(Enum):
+    SEARCH = 1
+    TABLE = 2
+    JUNCTION = 3
+
+
+class ChaseStrategy(Enum):
+    ASTAR = 1
+    INCREMENTAL = 2
+    FLOW_FIELD = 3
+
+
 def translate_to_maze(coords, size=32):
     return int(coords[0] / size), int(coords[1] / size)
 
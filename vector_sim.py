@@ -0,0 +1,232 @@
+import numpy as np
+
+from grid import MazeGrid
+from routing import RoutingTable, NO_HOP
+from utils import Direction, DIRECTION_BITS, GhostBehaviour, ScoreType
+
+CELL_SIZE = 32
+
+# Direction codes used by the arrays, index 0 is standing still
+NONE, UP, DOWN, LEFT, RIGHT = range(5)
+DIRECTIONS = [Direction.NONE, Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT]
+DIRECTION_X = np.array([0, 0, 0, -1, 1], dtype=np.int32)
+DIRECTION_Y = np.array([0, -1, 1, 0, 0], dtype=np.int32)
+
+CHASE = GhostBehaviour.CHASE.value
+PATROL = GhostBehaviour.PATROL.value
+
+# Same phase table and timeouts as World
+MODES = [(7, 20), (7, 20), (5, 20), (5, 100000)]
+POWER_SECONDS = 15
+
+
+class VectorSimulation:
+    # Steps B independent games in lockstep. All state lives in structure-of-arrays NumPy buffers with
+    # the game as the leading axis; cells are flat MazeGrid indices and agents move one pixel per step,
+    # like the object engine. Pickups resolve on the cell under Pacman's centre, rounded down in pixels
+    # as Agent.get_cell does, so they are taken on the same tick as in the object engine.
+    def __init__(self, numpy_maze, dot_spaces, powerup_spaces, ghost_spawns, batch: int = 64,
+                 pacman_spawn=(1, 1), fps: int = 120, seed=None):
+        self.grid = MazeGrid(numpy_maze)
+        self.batch = batch
+        self.fps = fps
+        self.rng = np.random.default_rng(seed)
+
+        grid = self.grid
+        self.offsets = np.array([0, *grid.offsets], dtype=np.int32)
+        legal_moves = np.frombuffer(grid.legal_moves, dtype=np.uint8)
+        # can_move[cell, direction] unpacks the grid's legal move table, NONE is always allowed
+        self.can_move = np.zeros((grid.size, 5), dtype=np.bool_)
+        self.can_move[:, NONE] = True
+        for code in (UP, DOWN, LEFT, RIGHT):
+            self.can_move[:, code] = (legal_moves & DIRECTION_BITS[DIRECTIONS[code]]) != 0
+
+        self.dot_layout = np.zeros(grid.size, dtype=np.bool_)
+        self.dot_layout[[grid.index(x, y) for x, y in dot_spaces]] = True
+        self.powerup_layout = np.zeros(grid.size, dtype=np.bool_)
+        self.powerup_layout[[grid.index(x, y) for x, y in powerup_spaces]] = True
+        self.ghost_spawns = np.array([grid.index(x, y) for x, y in ghost_spawns], dtype=np.int32)
+        self.pacman_spawn = grid.index(*pacman_spawn)
+        # Ghosts walk shortest maze paths, like the object engine's: the routing table's next hop towards
+        # Pacman while chasing, towards a random dot cell while patrolling. Ids are the table's compact ones.
+        self.routing = None
+        if len(self.ghost_spawns):
+            self.routing = RoutingTable(grid)
+            self.route_cells = np.array(self.routing.cells, dtype=np.int32)
+            self.patrol_goals = self.routing.compact[[grid.index(x, y) for x, y in dot_spaces]]
+
+        self.mode_scatter = np.array([timing[0] * fps for timing in MODES], dtype=np.int64)
+        self.mode_chase = np.array([timing[1] * fps for timing in MODES], dtype=np.int64)
+        self.power_ticks = POWER_SECONDS * fps
+
+        self.reset()
+
+    @classmethod
+    def from_engine(cls, game_engine, batch: int = 64, ghosts=True, **kwargs):
+        kwargs.setdefault("pacman_spawn", game_engine.pacman_spawn)
+        return cls(game_engine.numpy_maze, game_engine.dot_spaces, game_engine.powerup_spaces,
+                   game_engine.ghost_spawns if ghosts else [], batch, **kwargs)
+
+    def reset(self):
+        batch = self.batch
+        ghosts = len(self.ghost_spawns)
+
+        self.pacman_cell = np.full(batch, self.pacman_spawn, dtype=np.int32)
+        self.pacman_offset = np.zeros(batch, dtype=np.int32)
+        self.pacman_direction = np.zeros(batch, dtype=np.int8)
+
+        self.ghost_cell = np.tile(self.ghost_spawns, (batch, 1))
+        self.ghost_offset = np.zeros((batch, ghosts), dtype=np.int32)
+        self.ghost_direction = np.zeros((batch, ghosts), dtype=np.int8)
+        self.ghost_alive = np.ones((batch, ghosts), dtype=np.bool_)
+        self.ghost_goal = np.zeros((batch, ghosts), dtype=np.int32)
+        if ghosts:
+            self.ghost_goal[:] = self.rng.choice(self.patrol_goals, size=(batch, ghosts))
+
+        self.dots = np.tile(self.dot_layout, (batch, 1))
+        self.powerups = np.tile(self.powerup_layout, (batch, 1))
+        self.dots_left = self.dots.sum(axis=1).astype(np.int32)
+
+        self.score = np.zeros(batch, dtype=np.int64)
+        self.lives = np.full(batch, 3, dtype=np.int32)
+        self.won = np.zeros(batch, dtype=np.bool_)
+        self.done = np.zeros(batch, dtype=np.bool_)
+        self.ticks = np.zeros(batch, dtype=np.int64)
+
+        # World.tick starts with a mode switch out of CHASE into the first PATROL phase
+        self.power_timer = np.zeros(batch, dtype=np.int64)
+        self.ghost_mode = np.full(batch, PATROL, dtype=np.int8)
+        self.phase = np.ones(batch, dtype=np.int32)
+        self.mode_timer = np.full(batch, self.mode_scatter[0], dtype=np.int64)
+
+    def pixel_positions(self, cell, offset, direction):
+        y, x = np.divmod(cell, self.grid.stride)
+        return ((x - 1) * CELL_SIZE + offset * DIRECTION_X[direction],
+                (y - 1) * CELL_SIZE + offset * DIRECTION_Y[direction])
+
+    def step(self, actions=None, ghost_actions=None):
+        # ghost_actions, one direction code per game and ghost, replaces the ghosts' own moves
+        active = ~self.done
+        self._move_ghosts(active, None if ghost_actions is None else np.asarray(ghost_actions))
+        self._move_pacman(active, self._pacman_policy() if actions is None else np.asarray(actions))
+        self._handle_pickups(active)
+        self._handle_ghosts(active)
+        self.ticks[active] += 1
+        self._handle_timers(active)
+
+    def _advance(self, cell, offset, direction, moving):
+        offset[moving] += 1
+        arrived = moving & (offset == CELL_SIZE)
+        cell[arrived] += self.offsets[direction[arrived]]
+        offset[arrived] = 0
+
+    def _pacman_policy(self):
+        # Default vectorized policy: step onto a neighbouring dot, else keep going, else turn randomly
+        cell = self.pacman_cell
+        neighbours = cell[:, None] + self.offsets[None, 1:]
+        legal = self.can_move[cell, 1:]
+        has_dot = np.take_along_axis(self.dots, neighbours, axis=1)
+        same_direction = np.arange(1, 5)[None, :] == self.pacman_direction[:, None]
+        preference = has_dot * 4.0 + same_direction * 2.0 + self.rng.random(legal.shape)
+        return np.where(legal, preference, -1.0).argmax(axis=1).astype(np.int8) + 1
+
+    def _move_pacman(self, active, actions):
+        at_cell = active & (self.pacman_offset == 0)
+        chosen = actions.astype(np.int8)
+        legal = self.can_move[self.pacman_cell, chosen]
+        # Like the object engine, a move into a wall leaves Pacman standing still
+        self.pacman_direction[at_cell] = np.where(legal, chosen, NONE)[at_cell]
+        self._advance(self.pacman_cell, self.pacman_offset, self.pacman_direction,
+                      active & (self.pacman_direction != NONE))
+
+    def _move_ghosts(self, active, actions=None):
+        if self.ghost_cell.shape[1] == 0:
+            return
+        cell = self.ghost_cell
+        direction = self.ghost_direction
+        at_cell = active[:, None] & self.ghost_alive & (self.ghost_offset == 0)
+
+        if actions is not None:
+            chosen = actions.astype(np.int8)
+            chosen = np.where(self.can_move[cell, chosen], chosen, NONE)
+        else:
+            compact = self.routing.compact
+            here = compact[cell]
+            # Patrolling ghosts pick another random goal once they are on theirs
+            arrived = at_cell & (here == self.ghost_goal)
+            if arrived.any():
+                self.ghost_goal[arrived] = self.rng.choice(self.patrol_goals, size=int(arrived.sum()))
+            chasing = (self.ghost_mode == CHASE) & (self.power_timer == 0)
+            target = np.where(chasing[:, None], compact[self.pacman_cell][:, None], self.ghost_goal)
+            hop = self.routing.next_hop[target, here]
+            reachable = hop != NO_HOP
+            step = self.route_cells[np.where(reachable, hop, 0)] - cell
+            matches = step[..., None] == self.offsets[None, None, 1:]
+            # On the target cell the hop is the cell itself and the ghost waits
+            chosen = np.where(reachable & matches.any(axis=2), matches.argmax(axis=2) + 1, NONE).astype(np.int8)
+
+        direction[at_cell] = chosen[at_cell]
+        self._advance(cell, self.ghost_offset, direction,
+                      active[:, None] & self.ghost_alive & (direction != NONE))
+
+    def _handle_pickups(self, active):
+        games = np.arange(self.batch)
+        ahead = self.pacman_cell + self.offsets[self.pacman_direction]
+        # Moving up or left, the centre pixel only rounds down into the next cell one pixel later
+        backwards = (self.pacman_direction == UP) | (self.pacman_direction == LEFT)
+        centre = np.where(self.pacman_offset < CELL_SIZE // 2 + backwards, self.pacman_cell, ahead)
+
+        eaten = active & self.dots[games, centre]
+        self.dots[games[eaten], centre[eaten]] = False
+        self.dots_left[eaten] -= 1
+        self.score[eaten] += ScoreType.DOT.value
+
+        powered = active & self.powerups[games, centre] & (self.power_timer == 0)
+        self.powerups[games[powered], centre[powered]] = False
+        self.score[powered] += ScoreType.POWERUP.value
+        self.power_timer[powered] = self.power_ticks
+        self.ghost_mode[powered] = PATROL
+
+        self.won |= active & (self.dots_left == 0)
+
+    def _handle_ghosts(self, active):
+        if self.ghost_cell.shape[1] == 0:
+            self.done |= self.won
+            return
+        pacman_x, pacman_y = self.pixel_positions(self.pacman_cell, self.pacman_offset, self.pacman_direction)
+        ghost_x, ghost_y = self.pixel_positions(self.ghost_cell, self.ghost_offset, self.ghost_direction)
+        touching = (self.ghost_alive & active[:, None] &
+                    (np.abs(ghost_x - pacman_x[:, None]) < CELL_SIZE) &
+                    (np.abs(ghost_y - pacman_y[:, None]) < CELL_SIZE))
+
+        powered = (self.power_timer > 0)[:, None]
+        eaten = touching & powered
+        self.ghost_alive &= ~eaten
+        self.score += eaten.sum(axis=1) * ScoreType.GHOST.value
+
+        # Every ghost touching an unpowered Pacman costs a life, as in Pacman.handle_ghosts
+        hits = (touching & ~powered).sum(axis=1) * ~self.won
+        killed = hits > 0
+        self.lives = np.maximum(self.lives - hits, 0)
+        self.pacman_cell[killed] = self.pacman_spawn
+        self.pacman_offset[killed] = 0
+        self.pacman_direction[killed] = NONE
+        self.done |= self.won | (self.lives == 0)
+
+    def _handle_timers(self, active):
+        running = active & (self.power_timer > 0)
+        self.power_timer[running] -= 1
+
+        self.mode_timer[active] -= 1
+        switch = active & (self.mode_timer <= 0)
+        if not switch.any():
+            return
+        phase = np.minimum(self.phase, len(MODES) - 1)
+        leaving_chase = switch & (self.ghost_mode == CHASE)
+        entering_chase = switch & ~leaving_chase
+        # Mirrors World.handle_mode_switch, the timing comes from the phase before it is advanced
+        self.mode_timer[leaving_chase] = self.mode_scatter[phase[leaving_chase]]
+        self.mode_timer[entering_chase] = self.mode_chase[phase[entering_chase]]
+        self.phase[leaving_chase] += 1
+        self.ghost_mode[leaving_chase] = PATROL
+        self.ghost_mode[entering_chase] = CHASE
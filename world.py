@@ -1,24 +1,45 @@
+from time import perf_counter
+
 import pygame
+from grid import MazeGrid
+from instrumentation import instruments
+from pickups import PickupGrid, DOT, POWERUP
+from scheduler import TickScheduler
 from utils import Direction, GhostBehaviour, ScoreType
 
+CELL_SIZE = 32
+WALL_SIZE = CELL_SIZE - 2
+WALL_COLOR = (0, 100, 255)
+# Steps a windowed game takes at most between two frames
+MAX_CATCH_UP_STEPS = 8
+
 
 class GameElement:
     def __init__(self, world, x, y, size: int, color=(255, 0, 0), shape: bool = False):
         self.size = size
         self.world: World = world
-        self.screen = world.screen
         self.y = y
         self.x = x
         self.color = color
         self.circle = shape
         self.shape = pygame.Rect(self.x, self.y, size, size)
+        # Where the element was before the current step, for drawing it part of the way there
+        self.previous_x = x
+        self.previous_y = y
 
-    def draw(self):
+    def draw(self, alpha: float = 1.0):
+        # Draws the element alpha of the way from its previous position and returns the area drawn
+        x, y = self.get_render_position(alpha)
         if self.circle:
-            pygame.draw.circle(self.screen, self.color, (self.x, self.y), self.size)
-        else:
-            rect_object = pygame.Rect(self.x, self.y, self.size, self.size)
-            pygame.draw.rect(self.screen, self.color, rect_object, border_radius=3)
+            return pygame.draw.circle(self.world.screen, self.color, (x, y), self.size)
+        rect_object = pygame.Rect(x, y, self.size, self.size)
+        return pygame.draw.rect(self.world.screen, self.color, rect_object, border_radius=3)
+
+    def get_render_position(self, alpha: float = 1.0):
+        if alpha >= 1.0:
+            return self.x, self.y
+        return (round(self.previous_x + (self.x - self.previous_x) * alpha),
+                round(self.previous_y + (self.y - self.previous_y) * alpha))
 
     def tick(self):
         pass
@@ -30,46 +51,79 @@ class GameElement:
         self.x = x
         self.y = y
 
+    def teleport(self, x, y):
+        # Moves without drawing the way in between
+        self.set_position(x, y)
+        self.previous_x = x
+        self.previous_y = y
+
     def get_position(self):
         return self.x, self.y
 
 
 class Dot(GameElement):
+    COLOR = (255, 255, 0)
+    RADIUS = 2
+
     def __init__(self, screen, x, y):
-        super().__init__(screen, x, y, 2, (255, 255, 0), True)
+        super().__init__(screen, x, y, self.RADIUS, self.COLOR, True)
 
 
 class Powerup(GameElement):
-    def __init__(self, screen, x, y):
-        super().__init__(screen, x, y, 8, (255, 255, 255), True)
-
+    COLOR = (255, 255, 255)
+    RADIUS = 8
 
-class Wall(GameElement):
-    def __init__(self, screen, x, y, size: int, color=(0, 100, 255)):
-        super().__init__(screen, x * size, y * size, size - 2, color)
+    def __init__(self, screen, x, y):
+        super().__init__(screen, x, y, self.RADIUS, self.COLOR, True)
 
 
 class World:
-    def __init__(self, width: int, height: int):
-        pygame.init()
-        self.width = width
-        self.height = height
-        self.screen = pygame.display.set_mode((width, height))
-        pygame.display.set_caption('Pacman')
-
-        self.clock = pygame.time.Clock()
-
+    def __init__(self, grid: MazeGrid, headless: bool = False, cell_steps: bool = False):
+        self.width = grid.width * CELL_SIZE
+        self.height = grid.height * CELL_SIZE
+        # Headless worlds never open a window and step as fast as they can
+        self.headless = headless
+        # Ticks covered by one step. Agents move one pixel a tick, so with cell_steps every step moves them a
+        # whole cell and pickups, collisions, decisions and timers are only handled at cell boundaries.
+        self.step_ticks = CELL_SIZE if cell_steps else 1
+        # Opened by open_display once the world is run or drawn
+        self.screen = None
+        self.clock = None
+
+        # Timers of the game, in simulation ticks
+        self.scheduler = TickScheduler()
+
+        # Render layers, built on the first frame
+        self.background = None
+        self.pickup_layer = None
+        self.previous_rects = []
+        self.pickup_rects = []
+        self.fonts = {}
+        self.text_cache = {}
+        self.overlay_lines = []
+        self.overlay_tick = 0
+        self.ticks = 0
+        self.sim_steps = 0
+        self.frames_rendered = 0
         self.done = False
         self.won = False
 
         self.game_objects = []
-        self.walls = []
-        self.cookies = []
+        # Occupancy grid of the maze, wall collisions are answered from it
+        self.grid: MazeGrid = None
+        # Dots and powerups per maze cell, created together with the grid
+        self.pickups: PickupGrid = None
+        self.set_grid(grid)
+        # Set by replay.ReplayRecorder to log every tick
+        self.recorder = None
+        # planner.PathScheduler of the game when it batches path requests, served after every step
+        self.path_scheduler = None
+        # planner.PathPlanner of the game when searches run on a pool
+        self.planner = None
 
         from agent import Pacman
         self.pacman: Pacman = None
 
-        self.powerups = []
         self.ghosts = []
         self.lives = 3
         self.score = 0
@@ -79,6 +133,8 @@ class World:
         self.score_powerup_pickup = 50
 
         self.power_active = False
+        # Tick the current power runs out on, for planners that look ahead
+        self.power_end_tick = 0
         self.ghost_mode = GhostBehaviour.PATROL
 
         self.mode_switch_event = pygame.USEREVENT + 1
@@ -93,44 +149,170 @@ class World:
         ]
         self.current_phase = 0
 
-    def tick(self, fps: int):
-        black = (0, 0, 0)
-
+    def start(self, fps: int):
+        self.scheduler.fps = fps
         self.handle_mode_switch()
-        pygame.time.set_timer(self.pacman_mode, 200)  # open close mouth
+        self.set_timer(self.pacman_mode, 200)  # open close mouth
+
+    def open_display(self):
+        # Only the display and font modules are started, and only for worlds that are shown, so a
+        # simulation never initialises pygame
+        if self.screen is not None:
+            return
+        pygame.display.init()
+        pygame.font.init()
+        self.screen = pygame.display.set_mode((self.width, self.height))
+        pygame.display.set_caption('Pacman')
+        self.clock = pygame.time.Clock()
+
+    def tick(self, fps: int, max_ticks: int = None, render_fps: int = None):
+        # fps is the simulation rate in ticks a second. Windowed games draw at up to render_fps frames a
+        # second on top of it, fps when it is not given.
+        if not self.headless:
+            self.open_display()
+        self.start(fps)
+        if self.headless:
+            while not self.done:
+                self.advance()
+                if self.pacman is None or self.won:
+                    self.done = True
+                instruments.end_tick()
+                if max_ticks is not None and self.ticks >= max_ticks:
+                    self.done = True
+        else:
+            self.run_windowed(fps, max_ticks, render_fps or fps)
+            print("Game over")
+
+    def run_windowed(self, fps, max_ticks, render_fps):
+        # Fixed timestep: wall-clock time piles up in the accumulator and is paid out in whole steps, so
+        # the game runs at fps whatever the frame rate, and catches up after a slow frame with several
+        # steps in a row. Frames show the agents between their last two positions.
+        step_time = self.step_ticks / fps
+        accumulator = 0.0
+        previous = perf_counter()
         while not self.done:
+            now = perf_counter()
+            accumulator += now - previous
+            previous = now
+            steps = 0
+            while accumulator >= step_time and not self.done:
+                if steps == MAX_CATCH_UP_STEPS:
+                    # Too far behind to catch up, the game slows down instead of stalling the window
+                    accumulator = 0.0
+                    break
+                self.advance()
+                instruments.end_tick()
+                accumulator -= step_time
+                steps += 1
+                if max_ticks is not None and self.ticks >= max_ticks:
+                    self.done = True
+
+            with instruments.phase("render"):
+                self.render(accumulator / step_time)
+            self.clock.tick(render_fps)
+            with instruments.phase("input"):
+                self.handle_events()
+            instruments.end_frame()
+
+    def advance(self):
+        # One simulation step and the timers that ran out during it
+        self.step()
+        with instruments.phase("events"):
+            self.handle_scheduled_events()
+        self.sim_steps += 1
+
+    def step(self):
+        with instruments.phase("agents"):
+            for game_object in self.game_objects:
+                game_object.previous_x = game_object.x
+                game_object.previous_y = game_object.y
             for game_object in self.game_objects:
                 game_object.tick()
-                game_object.draw()
+        if self.path_scheduler is not None:
+            self.path_scheduler.serve(self.pacman)
+
+        if self.check_all_dots_collected():
+            self.win_game()
+        self.ticks += self.step_ticks
+        if self.recorder is not None:
+            self.recorder.record()
+
+    def render(self, alpha: float = 1.0):
+        # Walls live on a cached background and dots on their own layer, so a frame only restores and
+        # redraws the areas that moving agents, the HUD and eaten dots touched.
+        self.open_display()
+        full_redraw = self.background is None
+        if full_redraw:
+            self.build_layers()
+            self.screen.blit(self.background, (0, 0))
+            self.screen.blit(self.pickup_layer, (0, 0))
+
+        restore = self.previous_rects + self.pickup_rects
+        for rect in restore:
+            self.screen.blit(self.background, rect, rect)
+            self.screen.blit(self.pickup_layer, rect, rect)
+
+        drawn = []
+        for game_object in self.game_objects:
+            drawn.append(game_object.draw(alpha))
+
+        drawn.append(self.display_text(f"Score: {self.score},  Lives: {self.lives}"))
 
-            self.display_text(f"Score: {self.score},  Lives: {self.lives}")
+        if self.pacman is None:
+            drawn.append(self.display_text("GAME OVER", (self.width / 2 - 256, self.height / 2 - 256), 75))
+        if self.won:
+            drawn.append(self.display_text("YOU WON", (self.width / 2 - 256, self.height / 2 - 256), 100))
+            drawn.append(self.display_text("GAME WON", (self.width / 2 - 256, self.height / 2 - 256), 75))
 
-            if self.check_all_dots_collected():
-                self.win_game()
+        if instruments.enabled and instruments.overlay:
+            drawn.extend(self.draw_overlay())
 
-            if self.pacman is None:
-                self.display_text("GAME OVER", (self.width / 2 - 256, self.height / 2 - 256), 75)
-            if self.won:
-                self.display_text("GAME WON", (self.width / 2 - 256, self.height / 2 - 256), 75)
+        if full_redraw:
             pygame.display.flip()
-
-            self.clock.tick(fps)
-            self.screen.fill(black)
-            self.handle_events()
-
-        print("Game over")
+        else:
+            pygame.display.update(restore + drawn)
+        self.previous_rects = drawn
+        self.pickup_rects = []
+        self.frames_rendered += 1
+
+    def draw_overlay(self):
+        # Percentiles are recomputed twice a second rather than every frame
+        if self.ticks - self.overlay_tick >= 60 or not self.overlay_lines:
+            self.overlay_tick = self.ticks
+            self.overlay_lines = instruments.overlay_lines()
+        rects = []
+        for i, line in enumerate(self.overlay_lines):
+            rects.append(self.display_text(line, (CELL_SIZE, self.height - CELL_SIZE * 6 + i * 16), 14))
+        return rects
+
+    def build_layers(self):
+        black = (0, 0, 0)
+        self.background = pygame.Surface((self.width, self.height)).convert()
+        self.background.fill(black)
+        # Walls come straight from the grid, they are never game objects
+        grid = self.grid
+        for y in range(grid.height):
+            for x in range(grid.width):
+                if not grid.open[grid.index(x, y)]:
+                    rect = pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, WALL_SIZE, WALL_SIZE)
+                    pygame.draw.rect(self.background, WALL_COLOR, rect, border_radius=3)
+
+        self.pickup_layer = pygame.Surface((self.width, self.height)).convert()
+        self.pickup_layer.fill(black)
+        self.pickup_layer.set_colorkey(black)
+        self.draw_pickups(self.pickup_layer)
 
     def check_all_dots_collected(self):
-        return len(self.cookies) <= 0
+        return self.pickups.dot_count <= 0
 
     def win_game(self):
         self.won = True
-        self.display_text("YOU WON", (self.width / 2 - 256, self.height / 2 - 256), 100)
 
     def handle_mode_switch(self):
         current_phase_timings = self.modes[self.current_phase]
 
-        print(f"Current phase: {str(self.current_phase)}, current_phase_timings: {str(current_phase_timings)}")
+        if not self.headless:
+            print(f"Current phase: {str(self.current_phase)}, current_phase_timings: {str(current_phase_timings)}")
         scatter_timing = current_phase_timings[0]
         chase_timing = current_phase_timings[1]
 
@@ -141,28 +323,74 @@ class World:
             self.set_current_mode(GhostBehaviour.CHASE)
 
         used_timing = scatter_timing if self.ghost_mode == GhostBehaviour.PATROL else chase_timing
-        pygame.time.set_timer(self.mode_switch_event, used_timing * 1000)
+        self.set_timer(self.mode_switch_event, used_timing * 1000)
 
     def start_power_active_timeout(self):
-        pygame.time.set_timer(self.power_active_end_event, 15000)
+        self.set_timer(self.power_active_end_event, 15000)
+
+    def set_timer(self, event_type, millis):
+        # Timers count simulation ticks, so they keep time with the game rather than the wall clock
+        self.scheduler.set_timer(event_type, millis)
 
     def add_game_object(self, obj: GameElement):
         self.game_objects.append(obj)
 
-    def add_cookie(self, obj: GameElement):
-        self.game_objects.append(obj)
-        self.cookies.append(obj)
+    def add_cookie(self, cell):
+        self.pickups.add(cell[0], cell[1], DOT)
 
     def add_ghost(self, obj: GameElement):
         self.game_objects.append(obj)
         self.ghosts.append(obj)
 
-    def add_powerup(self, obj: GameElement):
-        self.game_objects.append(obj)
-        self.powerups.append(obj)
+    def remove_ghost(self, obj: GameElement):
+        # Eaten ghosts leave the game for good, so they are no longer ticked, drawn or targeted
+        if obj in self.game_objects:
+            self.game_objects.remove(obj)
+        self.ghosts.remove(obj)
+        if self.path_scheduler is not None:
+            self.path_scheduler.cancel(obj)
+        if self.planner is not None:
+            self.planner.cancel(obj)
+
+    def add_powerup(self, cell):
+        self.pickups.add(cell[0], cell[1], POWERUP)
+
+    def take_cookie(self, cell):
+        taken = self.pickups.take(cell[0], cell[1], DOT)
+        if taken:
+            self.erase_pickup(cell, Dot.RADIUS)
+            if self.recorder is not None:
+                self.recorder.record_pickup(cell, DOT)
+        return taken
+
+    def take_powerup(self, cell):
+        taken = self.pickups.take(cell[0], cell[1], POWERUP)
+        if taken:
+            self.erase_pickup(cell, Powerup.RADIUS)
+            if self.recorder is not None:
+                self.recorder.record_pickup(cell, POWERUP)
+        return taken
+
+    def erase_pickup(self, cell, radius):
+        if self.pickup_layer is None:
+            return
+        half = CELL_SIZE // 2
+        rect = pygame.Rect(cell[0] * CELL_SIZE + half - radius, cell[1] * CELL_SIZE + half - radius,
+                           radius * 2 + 1, radius * 2 + 1)
+        self.pickup_layer.fill((0, 0, 0), rect)
+        self.pickup_rects.append(rect)
+
+    def draw_pickups(self, surface):
+        half = CELL_SIZE / 2
+        for x, y in self.pickups.positions(DOT):
+            pygame.draw.circle(surface, Dot.COLOR, (x * CELL_SIZE + half, y * CELL_SIZE + half), Dot.RADIUS)
+        for x, y in self.pickups.positions(POWERUP):
+            pygame.draw.circle(surface, Powerup.COLOR, (x * CELL_SIZE + half, y * CELL_SIZE + half),
+                               Powerup.RADIUS)
 
     def activate_power(self):
         self.power_active = True
+        self.power_end_tick = self.ticks + self.scheduler.to_ticks(15000)
         self.set_current_mode(GhostBehaviour.PATROL)
         self.start_power_active_timeout()
 
@@ -191,34 +419,52 @@ class World:
 
     def kill_pacman(self):
         self.lives -= 1
-        self.pacman.set_position(32, 32)
+        self.pacman.teleport(*self.pacman.spawn)
         self.pacman.set_direction(Direction.NONE)
         if self.lives == 0:
             self.end_game()
 
+    def get_font(self, in_size):
+        font = self.fonts.get(in_size)
+        if font is None:
+            font = self.fonts[in_size] = pygame.font.SysFont('Arial', in_size)
+        return font
+
     def display_text(self, text, position=(32, 0), in_size=30):
-        font = pygame.font.SysFont('Arial', in_size)
-        text_surface = font.render(text, False, (255, 255, 255))
-        self.screen.blit(text_surface, position)
+        # Each text slot keeps its last rendering and only renders again when its text changes
+        slot = (position, in_size)
+        cached = self.text_cache.get(slot)
+        if cached is None or cached[0] != text:
+            cached = self.text_cache[slot] = (text, self.get_font(in_size).render(text, False, (255, 255, 255)))
+        return self.screen.blit(cached[1], position)
 
     def is_power_active(self):
         return self.power_active
 
-    def add_wall(self, obj: Wall):
-        self.add_game_object(obj)
-        self.walls.append(obj)
-
-    def get_walls(self):
-        return self.walls
-
-    def get_cookies(self):
-        return self.cookies
+    def set_grid(self, grid: MazeGrid):
+        self.grid = grid
+        self.pickups = PickupGrid(grid)
+
+    def collides_with_wall(self, x, y, size):
+        instruments.count("collision_checks")
+        # Walls fill the top left WALL_SIZE pixels of their cell, so a size x size box at (x, y) can
+        # only touch the cells in this range. Nothing outside the maze counts as a wall.
+        grid = self.grid
+        first_column = int((x - WALL_SIZE) // CELL_SIZE) + 1
+        last_column = -int(-(x + size) // CELL_SIZE) - 1
+        first_row = int((y - WALL_SIZE) // CELL_SIZE) + 1
+        last_row = -int(-(y + size) // CELL_SIZE) - 1
+        for row in range(max(first_row, 0), min(last_row, grid.height - 1) + 1):
+            for column in range(max(first_column, 0), min(last_column, grid.width - 1) + 1):
+                if not grid.open[grid.index(column, row)]:
+                    return True
+        return False
 
     def get_ghosts(self):
         return self.ghosts
 
-    def get_powerups(self):
-        return self.powerups
+    def get_pickups(self):
+        return self.pickups
 
     def get_game_objects(self):
         return self.game_objects
@@ -232,16 +478,18 @@ class World:
             if event.type == pygame.QUIT:
                 self.done = True
 
-            if event.type == self.mode_switch_event:
-                self.handle_mode_switch()
+    def handle_scheduled_events(self):
+        for event_type in self.scheduler.advance(self.step_ticks):
+            self.handle_timer_event(event_type)
 
-            if event.type == self.power_active_end_event:
-                self.power_active = False
+    def handle_timer_event(self, event_type):
+        if event_type == self.mode_switch_event:
+            self.handle_mode_switch()
 
-            if event.type == self.pacman_mode:
-                if self.pacman is None: break
-                self.pacman.mouth_open = not self.pacman.mouth_open
-
-        if self.pacman is None:
-            return
+        if event_type == self.power_active_end_event:
+            self.power_active = False
 
+        if event_type == self.pacman_mode:
+            if self.pacman is None:
+                return
+            self.pacman.mouth_open = not self.pacman.mouth_open